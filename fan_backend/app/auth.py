@@ -1,30 +1,127 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .database import get_db
-from .models import User
+from .cache import TTLCache
+from .database import get_async_db
+from .models import Transaction, User
+from .replica import read_session
 
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
+# .env, if any, has been loaded by .database above.
 SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret_key_for_local_only")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_WARM_SIZE = int(os.getenv("USER_CACHE_WARM_SIZE", "1000"))
+USER_CACHE_WARM_HOURS = float(os.getenv("USER_CACHE_WARM_HOURS", "24"))
+
+# Signing keys by kid, e.g. JWT_SIGNING_KEYS="2024a:secret1,2024b:secret2".
+# New tokens are signed with JWT_ACTIVE_KID; any listed key still verifies,
+# so a key can be rotated out once the tokens it signed have expired.
+# SECRET_KEY verifies tokens without a kid header (kid "default") only when
+# JWT_SIGNING_KEYS is unset or lists "default" itself, e.g.
+# JWT_SIGNING_KEYS="default,2024a:secret1" while those tokens age out.
+DEFAULT_KID = "default"
+
+def load_signing_keys(raw: str) -> Dict[str, str]:
+    keys = {}
+    for entry in raw.split(","):
+        kid, _, secret = entry.strip().partition(":")
+        if kid == DEFAULT_KID and not secret:
+            keys[kid] = SECRET_KEY
+        elif kid and secret:
+            keys[kid] = secret
+    if not keys:
+        keys[DEFAULT_KID] = SECRET_KEY
+    return keys
+
+SIGNING_KEYS = load_signing_keys(os.getenv("JWT_SIGNING_KEYS", ""))
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", DEFAULT_KID)
+if JWT_ACTIVE_KID not in SIGNING_KEYS:
+    raise RuntimeError(f"JWT_ACTIVE_KID {JWT_ACTIVE_KID!r} is not in JWT_SIGNING_KEYS")
+
+@lru_cache(maxsize=1)
+def password_context():
+    # passlib/bcrypt are only needed once a PIN is hashed or checked.
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# Detached User snapshots keyed by token subject (phone). Handlers get a copy
+# merged into their own session, so the cached instance is never mutated.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS)
+USER_CACHE_INVALIDATING_FIELDS = ("phone", "status", "credit_limit", "pin_hash", "user_type")
+
+# Verified access tokens -> (kid, subject, exp), so repeat requests with the
+# same token skip the HMAC check and claim parsing. Entries never outlive the
+# token's exp.
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl_seconds=TOKEN_CACHE_TTL_SECONDS)
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_cache_invalidations(session, flush_context):
+    phones = session.info.setdefault("user_cache_invalidations", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if obj in session.deleted or any(
+            state.attrs[field].history.has_changes() for field in USER_CACHE_INVALIDATING_FIELDS
+        ):
+            phones.add(obj.phone)
+            phones.update(state.attrs.phone.history.deleted or ())
+    for phone in phones:
+        user_cache.pop(phone)
+
+@event.listens_for(Session, "after_commit")
+def _apply_user_cache_invalidations(session):
+    # Evict again after commit in case another request re-cached the
+    # pre-commit row between our flush and commit.
+    for phone in session.info.pop("user_cache_invalidations", ()):
+        user_cache.pop(phone)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_cache_invalidations(session):
+    session.info.pop("user_cache_invalidations", None)
+
+def warm_user_cache(db: Session, limit: int = USER_CACHE_WARM_SIZE) -> int:
+    # Preloads users who requested an advance recently, so their first
+    # authenticated request after boot skips the lookup. Entries already
+    # cached by live requests are left alone.
+    if limit <= 0:
+        return 0
+    since = datetime.utcnow() - timedelta(hours=USER_CACHE_WARM_HOURS)
+    active = select(Transaction.user_id).where(Transaction.created_at >= since)
+    users = db.scalars(select(User).where(User.id.in_(active)).limit(limit)).all()
+    warmed = 0
+    for user in users:
+        if user_cache.get(user.phone, count=False) is None:
+            db.expunge(user)
+            user_cache.set(user.phone, user)
+            warmed += 1
+    return warmed
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_context().hash(password)
+
+def _encode(claims: dict) -> str:
+    return jwt.encode(claims, SIGNING_KEYS[JWT_ACTIVE_KID], algorithm=ALGORITHM, headers={"kid": JWT_ACTIVE_KID})
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -32,35 +129,93 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    to_encode.update({"exp": expire, "typ": "access"})
+    return _encode(to_encode)
 
-def verify_token(token: str):
+def pin_version(pin_hash: Optional[str]) -> str:
+    # Changes whenever the PIN does, which invalidates outstanding refresh
+    # tokens without keeping any server-side token state.
+    return hashlib.sha256((pin_hash or "").encode()).hexdigest()[:16]
+
+def create_refresh_token(user: User, expires_delta: Optional[timedelta] = None):
+    expire = datetime.utcnow() + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    return _encode({"sub": user.phone, "typ": "refresh", "pv": pin_version(user.pin_hash), "exp": expire})
+
+def issue_tokens(user: User) -> dict:
+    return {
+        "access_token": create_access_token(
+            data={"sub": user.phone}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        ),
+        "refresh_token": create_refresh_token(user),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "user": user
+    }
+
+def _credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def decode_token(token: str, token_type: str = "access") -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        phone = payload.get("sub")
-        if not isinstance(phone, str) or phone is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return phone
+        kid = jwt.get_unverified_header(token).get("kid", DEFAULT_KID)
+        key = SIGNING_KEYS.get(kid)
+        if key is None:
+            raise _credentials_exception()
+        payload = jwt.decode(token, key, algorithms=[ALGORITHM])
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credentials_exception()
+    # Access tokens issued before refresh tokens existed carry no "typ".
+    if payload.get("typ", "access") != token_type or not isinstance(payload.get("sub"), str):
+        raise _credentials_exception()
+    payload["kid"] = kid
+    return payload
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+def verify_token(token: str):
+    cached = token_cache.get(token)
+    if cached is not None:
+        kid, phone, expires_at = cached
+        if expires_at > time.time() and kid in SIGNING_KEYS:
+            return phone
+        token_cache.pop(token)
+    
+    payload = decode_token(token)
+    phone = payload["sub"]
+    remaining = payload.get("exp", 0) - time.time()
+    if remaining > 0:
+        token_cache.set(token, (payload["kid"], phone, payload["exp"]), ttl_seconds=min(remaining, TOKEN_CACHE_TTL_SECONDS))
+    return phone
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_async_db)):
     phone = verify_token(credentials.credentials)
-    user = db.query(User).filter(User.phone == phone).first()
+    cached_user = user_cache.get(phone)
+    if cached_user is not None:
+        return await db.merge(cached_user, load=False)
+    
+    async with read_session(phone) as read_db:
+        user = await read_db.scalar(select(User).where(User.phone == phone))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return user
+    user_cache.set(phone, user)
+    return await db.merge(user, load=False)
+
+async def get_admin_user(current_user: User = Depends(get_current_user)):
+    if current_user.user_type != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required",
+        )
+    return current_user
+
+async def get_user_read_db(current_user: User = Depends(get_current_user)):
+    # Read-only session for the caller's own data: the replica, or the
+    # primary right after the caller wrote something.
+    async with read_session(current_user.id) as db:
+        yield db
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+logger = logging.getLogger(__name__)
+
+_tasks: List[asyncio.Task] = []
+
+async def _run_periodically(name: str, interval_seconds: float, job: Callable[[], Awaitable[object]]):
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Background job %s failed", name)
+        await asyncio.sleep(interval_seconds)
+
+def start_periodic(name: str, interval_seconds: float, job: Callable[[], Awaitable[object]]) -> asyncio.Task:
+    task = asyncio.get_running_loop().create_task(_run_periodically(name, interval_seconds, job), name=name)
+    _tasks.append(task)
+    return task
+
+def start_task(name: str, coroutine: Awaitable[object]) -> asyncio.Task:
+    task = asyncio.get_running_loop().create_task(coroutine, name=name)
+    _tasks.append(task)
+    return task
+
+async def stop_all():
+    tasks = list(_tasks)
+    _tasks.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from .models import PartnerStation
+from .serialization import station_rows
+
+STATION_CATALOGUE_TTL_SECONDS = float(os.getenv("STATION_CATALOGUE_TTL_SECONDS", "60"))
+
+class CatalogueSnapshot(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: Optional[datetime]
+    built_at: float
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+def parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+class StationCatalogue:
+    # The active-station list as ready-to-send JSON bytes plus its validators,
+    # rebuilt only after a station changes (or the TTL passes, to pick up
+    # changes made by other workers). Last-Modified covers inactive stations
+    # too, so deactivating one also moves it.
+    def __init__(self, ttl_seconds: float = STATION_CATALOGUE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[CatalogueSnapshot] = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[CatalogueSnapshot]:
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.built_at > self.ttl_seconds:
+            return None
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._snapshot = None
+
+    def get(self, db: Session) -> CatalogueSnapshot:
+        snapshot = self.current()
+        if snapshot is not None:
+            return snapshot
+
+        version = self._version
+        stations = db.execute(
+            station_rows.select().where(PartnerStation.status == "active").order_by(PartnerStation.id)
+        ).all()
+        last_modified = db.scalar(select(func.max(PartnerStation.updated_at)))
+        body = station_rows.encode(stations)
+        snapshot = CatalogueSnapshot(
+            body=body,
+            etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+            last_modified=last_modified,
+            built_at=time.monotonic()
+        )
+        with self._lock:
+            # A change committed while we were reading keeps the cache empty.
+            if version == self._version:
+                self._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def changed_since(db: Session, since: datetime) -> list:
+        # Every station touched after `since`, inactive ones included, so a
+        # client can drop stations that were deactivated.
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        snapshot = station_catalogue.current()
+        if snapshot is not None and snapshot.last_modified is not None and since >= snapshot.last_modified:
+            return []
+        return db.execute(
+            station_rows.select().where(PartnerStation.updated_at > since).order_by(PartnerStation.updated_at, PartnerStation.id)
+        ).all()
+
+def is_not_modified(snapshot: CatalogueSnapshot, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    if if_none_match is not None:
+        return snapshot.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if if_modified_since is not None and snapshot.last_modified is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and snapshot.last_modified.replace(microsecond=0) <= since
+    return False
+
+station_catalogue = StationCatalogue()
+
+@event.listens_for(Session, "after_flush")
+def _collect_station_changes(session, flush_context):
+    if any(isinstance(obj, PartnerStation) for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info["station_catalogue_changed"] = True
+        station_catalogue.invalidate()
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_station_catalogue(session):
+    if session.info.pop("station_catalogue_changed", False):
+        station_catalogue.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_station_changes(session):
+    session.info.pop("station_catalogue_changed", None)
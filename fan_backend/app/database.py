@@ -1,20 +1,226 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+import os
+import sqlite3
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from .instrumentation import after_cursor_execute, before_cursor_execute, handle_cursor_error
+from .metrics import REGISTRY
 from .models import Base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./fan_app.db"
+# Containers pass configuration through the environment; LOAD_DOTENV=false
+# skips importing python-dotenv and searching for a .env file.
+if os.getenv("LOAD_DOTENV", "true").lower() in ("1", "true", "yes"):
+    from dotenv import load_dotenv
+    load_dotenv()
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+logger = logging.getLogger(__name__)
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./fan_app.db")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# "create_all" creates missing tables on boot; "migrations" expects
+# `alembic upgrade head` to have run at deploy time and only checks that the
+# database is stamped at the head revision. Neither changes existing tables:
+# a database built by create_all before migrations existed is brought up to
+# the models and stamped with `python -m app.schema adopt`, and
+# `python -m app.schema check` lists what a database is missing.
+SCHEMA_MODE = os.getenv("SCHEMA_MODE", "create_all")
+
+# Optional read replica for read-only routes; unset, reads use the primary.
+# Routing and read-your-writes live in replica.py.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+# Local stand-in for replication: copies a SQLite primary onto a SQLite
+# READ_DATABASE_URL every this many seconds (0 disables).
+REPLICA_SYNC_INTERVAL_SECONDS = float(os.getenv("REPLICA_SYNC_INTERVAL_SECONDS", "0"))
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+POOL_CHECKOUT_SECONDS = REGISTRY.histogram(
+    "fan_db_pool_checkout_seconds",
+    "Time spent waiting for a pooled database connection",
+    ["engine"],
+)
+POOL_CONNECTIONS = REGISTRY.gauge(
+    "fan_db_pool_connections",
+    "Pooled database connections by state",
+    ["engine", "state"],
+)
+
+def to_async_url(url: str) -> str:
+    # Derive the asyncio driver for a sync DATABASE_URL: aiosqlite for SQLite,
+    # psycopg (already a dependency, async-capable) for PostgreSQL.
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if parsed.get_backend_name() == "postgresql" and parsed.get_driver_name() in ("psycopg2", "psycopg", ""):
+        return parsed.set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+    return url
+
+# aiosqlite locally; postgresql+asyncpg://... or postgresql+psycopg://... in
+# production. Derived from DATABASE_URL unless set explicitly.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+ASYNC_READ_DATABASE_URL = os.getenv("ASYNC_READ_DATABASE_URL") or (
+    to_async_url(READ_DATABASE_URL) if READ_DATABASE_URL else None
 )
+
+class TimedQueuePool(QueuePool):
+    metrics_label = "sync"
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, engine=self.metrics_label)
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, engine=self.metrics_label)
+
+class TimedAsyncReadQueuePool(TimedAsyncQueuePool):
+    metrics_label = "async_read"
+
+def engine_options(url: str, poolclass) -> dict:
+    parsed = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if parsed.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if parsed.database in (None, "", ":memory:"):
+            # In-memory databases use SQLAlchemy's per-thread default pool.
+            return options
+    options.update(
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+def _instrument(sync_engine: Engine, label: str):
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(sync_engine, "handle_error", handle_cursor_error)
+    pool = sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        POOL_CONNECTIONS.set_function(pool.checkedout, engine=label, state="in_use")
+        POOL_CONNECTIONS.set_function(pool.checkedin, engine=label, state="idle")
+        POOL_CONNECTIONS.set_function(lambda: max(pool.overflow(), 0), engine=label, state="overflow")
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL, TimedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_instrument(engine, "sync")
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, TimedAsyncQueuePool))
+# Objects stay usable after commit: async code cannot lazily reload expired
+# attributes, and handlers serialize ORM objects after the service commits.
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+_instrument(async_engine.sync_engine, "async")
+
+if ASYNC_READ_DATABASE_URL:
+    async_read_engine = create_async_engine(
+        ASYNC_READ_DATABASE_URL, **engine_options(ASYNC_READ_DATABASE_URL, TimedAsyncReadQueuePool)
+    )
+    _instrument(async_read_engine.sync_engine, "async_read")
+else:
+    async_read_engine = async_engine
+REPLICA_ENABLED = async_read_engine is not async_engine
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False, info={"read_only": True}
+)
+
+@event.listens_for(Session, "before_flush")
+def _reject_read_only_writes(session, flush_context, instances):
+    if session.info.get("read_only") and (session.new or session.dirty or session.deleted):
+        raise RuntimeError("Attempted to write through a read-only session")
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
 
+def migration_head() -> str:
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory(os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")).get_current_head()
+
+def check_schema_revision() -> str:
+    try:
+        with engine.connect() as conn:
+            revision = conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except DBAPIError:
+        revision = None
+    if not revision:
+        raise RuntimeError("SCHEMA_MODE=migrations but no migration has been applied; run `alembic upgrade head`")
+    head = migration_head()
+    if revision != head:
+        raise RuntimeError(f"Database schema is at revision {revision}, expected {head}; run `alembic upgrade head`")
+    return revision
+
+def prepare_schema():
+    if SCHEMA_MODE == "migrations":
+        logger.info("Database schema at revision %s", check_schema_revision())
+    elif SCHEMA_MODE == "create_all":
+        create_tables()
+    else:
+        raise RuntimeError(f"Unknown SCHEMA_MODE {SCHEMA_MODE!r}")
+
+def dialect_insert(db: Session):
+    # INSERT construct with ON CONFLICT support for the session's backend.
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def sync_sqlite_replica():
+    # Replication stand-in for local runs: copies the whole SQLite primary
+    # onto the SQLite replica with the online backup API, so replica reads
+    # lag by up to REPLICA_SYNC_INTERVAL_SECONDS.
+    primary, replica = make_url(SQLALCHEMY_DATABASE_URL), make_url(READ_DATABASE_URL or "sqlite://")
+    if primary.get_backend_name() != "sqlite" or replica.get_backend_name() != "sqlite" or not replica.database:
+        raise RuntimeError("REPLICA_SYNC_INTERVAL_SECONDS needs SQLite DATABASE_URL and READ_DATABASE_URL files")
+    source = engine.raw_connection()
+    try:
+        with sqlite3.connect(replica.database, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000) as target:
+            source.driver_connection.backup(target)
+    finally:
+        source.close()
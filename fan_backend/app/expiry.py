@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .database import AsyncSessionLocal
+from .metrics import REGISTRY
+from .models import Transaction
+from .services import TransactionService
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+EXPIRY_MAX_SLEEP_SECONDS = float(os.getenv("EXPIRY_MAX_SLEEP_SECONDS", "60"))
+EXPIRY_RETRY_SECONDS = float(os.getenv("EXPIRY_RETRY_SECONDS", "5"))
+
+EXPIRED_TOTAL = REGISTRY.counter(
+    "fan_transactions_expired_total",
+    "Pending advances moved to expired by the expiry scheduler",
+)
+EXPIRY_BATCH_SIZE_HISTOGRAM = REGISTRY.histogram(
+    "fan_expiry_batch_size",
+    "Transactions expired per scheduler batch",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+EXPIRY_LAG_SECONDS = REGISTRY.histogram(
+    "fan_expiry_lag_seconds",
+    "Delay between the oldest expires_at in a batch and the batch running",
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0),
+)
+
+class ExpiryScheduler:
+    # Sleeps until the next pending advance is due, found with a MIN() seek on
+    # the (status, expires_at) index, then expires due rows oldest first in
+    # bounded batches. The seek is shared state in the database, so several
+    # workers can run it side by side: the UPDATE only touches rows that are
+    # still pending, and credit is released for the rows it returns.
+    def __init__(self, batch_size: int = EXPIRY_BATCH_SIZE, max_sleep_seconds: float = EXPIRY_MAX_SLEEP_SECONDS):
+        self.batch_size = batch_size
+        self.max_sleep_seconds = max_sleep_seconds
+        self._wake: Optional[asyncio.Event] = None
+        self._wake_at: Optional[datetime] = None
+
+    def next_due(self, db: Session) -> Optional[datetime]:
+        return db.scalar(select(func.min(Transaction.expires_at)).where(Transaction.status == "pending"))
+
+    def expire_batch(self, db: Session, now: Optional[datetime] = None) -> list:
+        now = now or datetime.utcnow()
+        due_ids = (
+            select(Transaction.id)
+            .where(Transaction.status == "pending", Transaction.expires_at <= now)
+            .order_by(Transaction.expires_at)
+            .limit(self.batch_size)
+        )
+        expired = TransactionService.expire_transactions(db, Transaction.id.in_(due_ids.scalar_subquery()), now=now)
+        db.commit()
+        if expired:
+            EXPIRED_TOTAL.inc(len(expired))
+            EXPIRY_BATCH_SIZE_HISTOGRAM.observe(len(expired))
+            EXPIRY_LAG_SECONDS.observe((now - min(row.expires_at for row in expired)).total_seconds())
+        return expired
+
+    def sweep(self, db: Session) -> Tuple[int, Optional[datetime]]:
+        expired = self.expire_batch(db)
+        return len(expired), self.next_due(db)
+
+    def notify(self, expires_at: datetime):
+        # Called when a pending advance is created; wakes the scheduler only
+        # if the new row is due before its current wake-up time.
+        if self._wake is not None and (self._wake_at is None or expires_at < self._wake_at):
+            self._wake.set()
+
+    async def _sleep_until(self, due: Optional[datetime], delay: Optional[float] = None):
+        if delay is None:
+            delay = self.max_sleep_seconds
+            if due is not None:
+                delay = min(delay, max(0.0, (due - datetime.utcnow()).total_seconds()))
+        self._wake_at = datetime.utcnow() + timedelta(seconds=delay)
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    expired, next_due = await db.run_sync(self.sweep)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Transaction expiry sweep failed")
+                await self._sleep_until(None, EXPIRY_RETRY_SECONDS)
+                continue
+            if expired >= self.batch_size:
+                # Backlog: go straight on to the next batch, yielding first.
+                await asyncio.sleep(0)
+                continue
+            await self._sleep_until(next_due)
+
+expiry_scheduler = ExpiryScheduler()
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+
+from .database import AsyncSessionLocal
+from .models import Payment, Transaction
+from .pagination import filter_by_status_and_date
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+EXPORT_MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# Exported columns per dataset. QR codes are left out on purpose: a pending
+# code is a bearer credential and finance has no use for it.
+EXPORT_COLUMNS = {
+    "transactions": (
+        Transaction.id, Transaction.user_id, Transaction.station_id, Transaction.amount,
+        Transaction.status, Transaction.created_at, Transaction.expires_at, Transaction.completed_at,
+    ),
+    "payments": (
+        Payment.id, Payment.transaction_id, Payment.user_id, Payment.amount, Payment.method,
+        Payment.reference, Payment.status, Payment.created_at, Payment.processed_at,
+    ),
+}
+EXPORT_MODELS = {"transactions": Transaction, "payments": Payment}
+
+def build_export_query(
+    dataset: str,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    station_id: Optional[int] = None,
+):
+    model = EXPORT_MODELS[dataset]
+    stmt = select(*EXPORT_COLUMNS[dataset])
+    if station_id is not None:
+        if model is Payment:
+            stmt = stmt.join(Transaction, Payment.transaction_id == Transaction.id)
+        stmt = stmt.where(Transaction.station_id == station_id)
+    stmt = filter_by_status_and_date(stmt, model, status, created_from, created_to)
+    return stmt.order_by(model.created_at, model.id)
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+async def stream_export(stmt, fmt: str, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    # Rows come off a server-side cursor batch_size at a time and are encoded
+    # into one chunk per batch, so memory stays flat however many rows match.
+    # The session lives inside the generator because the response outlives
+    # the request's own dependencies.
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=batch_size))
+        columns = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(columns)
+        async for rows in result.partitions():
+            if fmt == "csv":
+                writer.writerows([_export_value(value) for value in row] for row in rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps({column: _export_value(value) for column, value in zip(columns, row)}))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if fmt == "csv" and buffer.tell():
+            yield buffer.getvalue().encode()
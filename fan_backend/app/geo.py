@@ -0,0 +1,135 @@
+import math
+import os
+import threading
+import time
+from heapq import nsmallest
+from typing import Dict, Iterable, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+STATION_INDEX_CELL_DEGREES = float(os.getenv("STATION_INDEX_CELL_DEGREES", "0.05"))
+STATION_INDEX_TTL_SECONDS = float(os.getenv("STATION_INDEX_TTL_SECONDS", "300"))
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class StationIndex:
+    # Uniform lat/lon grid. Each cell holds (station_id, lat, lon) tuples, so a
+    # radius query only touches the cells overlapping the query's bounding box.
+    def __init__(self, cell_degrees: float = STATION_INDEX_CELL_DEGREES, ttl_seconds: float = STATION_INDEX_TTL_SECONDS):
+        self.cell_degrees = cell_degrees
+        self.ttl_seconds = ttl_seconds
+        self._lon_cells = int(math.ceil(360.0 / cell_degrees))
+        self._cells: Dict[Tuple[int, int], List[Tuple[int, float, float]]] = {}
+        self._locations: Dict[int, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        row = int(math.floor((latitude + 90.0) / self.cell_degrees))
+        col = int(math.floor((longitude + 180.0) / self.cell_degrees)) % self._lon_cells
+        return row, col
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl_seconds
+
+    def rebuild(self, points: Iterable[Tuple[int, float, float]]):
+        cells: Dict[Tuple[int, int], List[Tuple[int, float, float]]] = {}
+        locations: Dict[int, Tuple[int, int]] = {}
+        for station_id, latitude, longitude in points:
+            key = self._cell(latitude, longitude)
+            cells.setdefault(key, []).append((station_id, latitude, longitude))
+            locations[station_id] = key
+        with self._lock:
+            self._cells = cells
+            self._locations = locations
+            self.loaded_at = time.monotonic()
+
+    def upsert(self, station_id: int, latitude: float, longitude: float):
+        with self._lock:
+            self._discard(station_id)
+            key = self._cell(latitude, longitude)
+            self._cells.setdefault(key, []).append((station_id, latitude, longitude))
+            self._locations[station_id] = key
+
+    def remove(self, station_id: int):
+        with self._lock:
+            self._discard(station_id)
+
+    def _discard(self, station_id: int):
+        key = self._locations.pop(station_id, None)
+        if key is None:
+            return
+        remaining = [point for point in self._cells[key] if point[0] != station_id]
+        if remaining:
+            self._cells[key] = remaining
+        else:
+            del self._cells[key]
+
+    def _candidate_cells(self, latitude: float, longitude: float, radius_km: float):
+        cells = self._cells
+        dlat = radius_km / KM_PER_DEGREE
+        row_min, _ = self._cell(max(-90.0, latitude - dlat), longitude)
+        row_max, _ = self._cell(min(90.0, latitude + dlat), longitude)
+
+        max_abs_lat = min(90.0, abs(latitude) + dlat)
+        cos_lat = math.cos(math.radians(max_abs_lat))
+        if cos_lat <= 1e-9 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180.0:
+            columns = None
+        else:
+            dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+            _, col_min = self._cell(latitude, longitude - dlon)
+            _, col_max = self._cell(latitude, longitude + dlon)
+            if col_min <= col_max:
+                columns = range(col_min, col_max + 1)
+            else:
+                columns = list(range(col_min, self._lon_cells)) + list(range(0, col_max + 1))
+
+        column_count = self._lon_cells if columns is None else len(columns)
+        if (row_max - row_min + 1) * column_count > len(cells):
+            column_set = None if columns is None else set(columns)
+            for (row, col), points in list(cells.items()):
+                if row_min <= row <= row_max and (column_set is None or col in column_set):
+                    yield points
+            return
+
+        for row in range(row_min, row_max + 1):
+            for col in columns if columns is not None else range(self._lon_cells):
+                points = cells.get((row, col))
+                if points:
+                    yield points
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[int, float]]:
+        matches = []
+        for points in self._candidate_cells(latitude, longitude, radius_km):
+            for station_id, lat, lon in points:
+                distance = haversine_km(latitude, longitude, lat, lon)
+                if distance <= radius_km:
+                    matches.append((station_id, distance))
+        return matches
+
+    def nearest(self, latitude: float, longitude: float, radius_km: Optional[float] = None, limit: int = 10) -> List[Tuple[int, float]]:
+        if radius_km is not None:
+            return nsmallest(limit, self.within(latitude, longitude, radius_km), key=lambda match: match[1])
+
+        # Unbounded k-nearest: grow the search radius until it holds `limit`
+        # stations. Every station inside the radius is seen, so the k closest
+        # found are the true k closest.
+        search_km = max(self.cell_degrees * KM_PER_DEGREE, 1.0)
+        max_km = math.pi * EARTH_RADIUS_KM
+        while True:
+            matches = self.within(latitude, longitude, search_km)
+            if len(matches) >= limit or search_km >= max_km:
+                return nsmallest(limit, matches, key=lambda match: match[1])
+            search_km = min(search_km * 2, max_km)
+
+station_index = StationIndex()
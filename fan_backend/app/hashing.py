@@ -0,0 +1,104 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+from .auth import get_password_hash, verify_password
+from .metrics import REGISTRY
+
+PIN_HASH_WORKERS = int(os.getenv("PIN_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PIN_HASH_MAX_PENDING = int(os.getenv("PIN_HASH_MAX_PENDING", "64"))
+
+PIN_HASH_SECONDS = REGISTRY.histogram(
+    "fan_pin_hash_seconds",
+    "bcrypt hash/verify time including queueing for a worker",
+    ["operation"],
+)
+PIN_HASH_POOL_RESTARTS = REGISTRY.counter(
+    "fan_pin_hash_pool_restarts_total",
+    "PIN hashing process pools replaced after a worker died",
+)
+
+class PasswordHasherPool:
+    # Runs bcrypt in a dedicated process pool so a burst of logins cannot
+    # occupy the event loop or the request threadpool. Once `max_pending`
+    # operations are queued, callers get a 503 instead of queueing forever.
+    # workers=0 falls back to the request threadpool. A pool broken by a
+    # dying worker (e.g. an OOM kill) is replaced and the call retried once.
+    def __init__(self, workers: int = PIN_HASH_WORKERS, max_pending: int = PIN_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        # Concurrent callers may all see the same broken pool; only the first
+        # one replaces it.
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, func, *args):
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                PIN_HASH_POOL_RESTARTS.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is unavailable, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _run(self, operation: str, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return await run_in_threadpool(func, *args)
+            return await self._submit(func, *args)
+        finally:
+            self.pending -= 1
+            PIN_HASH_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password, password, hashed_password)
+
+    def start(self):
+        if self.workers > 0:
+            self._get_executor()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasherPool()
@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "3600"))
+# How long a repeat waits for the request holding its key before getting 409.
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_POLL_SECONDS = 0.05
+# A claim still without a response after this long belongs to a request that
+# died mid-write; the next repeat takes it over.
+IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS = float(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS", "60"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_REPLAYED_HEADER = "Idempotent-Replayed"
+
+class IdempotencyClaim:
+    # A key held by the current request through the pending row `row_id`. The
+    # first new `model` row the session flushes is the write it guards; its
+    # response is written to the pending row just before the session commits,
+    # in the same transaction.
+    __slots__ = ("scope", "user_id", "key", "fingerprint", "model", "schema", "row_id", "resource", "recorded")
+
+    def __init__(self, scope: str, user_id: int, key: str, fingerprint: str, model, schema):
+        self.scope = scope
+        self.user_id = user_id
+        self.key = key
+        self.fingerprint = fingerprint
+        self.model = model
+        self.schema = schema
+        self.row_id = None
+        self.resource = None
+        self.recorded = False
+
+class IdempotencyStore:
+    # Remembers the result of a successful write per (scope, user, key) for
+    # the TTL and hands it back to repeats without running the write again.
+    # Keys live in the idempotency_keys table under a unique constraint, so
+    # every worker sees them. A request first commits a pending row for its
+    # key, then runs the write; a concurrent repeat finds that row, waits for
+    # its response and replays it, or gets 409 if the write is still running
+    # after IDEMPOTENCY_WAIT_SECONDS. Failed writes release their claim, so a
+    # client can retry them with the same key.
+    def __init__(
+        self,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+        wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS,
+        claim_timeout_seconds: float = IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.claim_timeout_seconds = claim_timeout_seconds
+
+    @staticmethod
+    def _check_fingerprint(stored: str, fingerprint: str):
+        if stored != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+    def lookup(self, claim: IdempotencyClaim, db: Session) -> Optional[IdempotencyKey]:
+        stored = db.scalar(select(IdempotencyKey).where(
+            IdempotencyKey.scope == claim.scope,
+            IdempotencyKey.user_id == claim.user_id,
+            IdempotencyKey.key == claim.key,
+        ))
+        if stored is None:
+            return None
+        timeout = self.ttl_seconds if stored.response is not None else self.claim_timeout_seconds
+        if stored.created_at < datetime.utcnow() - timedelta(seconds=timeout):
+            # Expired but not purged yet, or abandoned by a request that
+            # died mid-write: free the key for this request.
+            db.delete(stored)
+            db.flush()
+            return None
+        return stored
+
+    def try_claim(self, claim: IdempotencyClaim, db: Session) -> Tuple[bool, Optional[IdempotencyKey]]:
+        # (True, None) once this request holds the key, otherwise (False, row
+        # holding it); the row is None if its holder released it meanwhile.
+        stored = self.lookup(claim, db)
+        if stored is None:
+            row = IdempotencyKey(
+                scope=claim.scope, user_id=claim.user_id, key=claim.key, fingerprint=claim.fingerprint,
+            )
+            db.add(row)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                stored = self.lookup(claim, db)
+            else:
+                claim.row_id = row.id
+                return True, None
+        db.commit()
+        return False, stored
+
+    @staticmethod
+    def release(claim: IdempotencyClaim, db: Session):
+        db.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.id == claim.row_id, IdempotencyKey.response.is_(None))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    async def _release(self, claim: IdempotencyClaim, db: AsyncSession):
+        async with AsyncSession(db.bind) as claim_db:
+            await claim_db.run_sync(lambda session: self.release(claim, session))
+
+    async def _acquire(self, claim: IdempotencyClaim, db: AsyncSession) -> Optional[Any]:
+        # Returns the response to replay, or None once this request holds the
+        # key. Claims go through their own session so the pending row is
+        # committed without touching the request's.
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            async with AsyncSession(db.bind, expire_on_commit=False) as claim_db:
+                claimed, stored = await claim_db.run_sync(lambda session: self.try_claim(claim, session))
+            if claimed:
+                return None
+            if stored is not None:
+                self._check_fingerprint(stored.fingerprint, claim.fingerprint)
+                if stored.response is not None:
+                    return stored.response
+                if time.monotonic() >= deadline:
+                    raise HTTPException(
+                        status_code=409,
+                        detail="A request with this Idempotency-Key is still in progress",
+                        headers={"Retry-After": "1"},
+                    )
+                await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    async def run(self, claim: IdempotencyClaim, db: AsyncSession, call: Callable[[], Awaitable[Any]]) -> tuple:
+        # Returns (result, replayed).
+        stored = await self._acquire(claim, db)
+        if stored is not None:
+            return stored, True
+
+        db.info["idempotency_claim"] = claim
+        try:
+            result = await call()
+        except Exception:
+            await db.rollback()
+            await self._release(claim, db)
+            raise
+        finally:
+            db.info.pop("idempotency_claim", None)
+        if not claim.recorded:
+            # Nothing was written, so there is nothing to replay.
+            await self._release(claim, db)
+        return result, False
+
+    def purge_expired(self, db: Session) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        result = db.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.created_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+
+@event.listens_for(Session, "after_flush")
+def _collect_idempotent_resource(session, flush_context):
+    claim = session.info.get("idempotency_claim")
+    if claim is None or claim.resource is not None:
+        return
+    for obj in session.new:
+        if isinstance(obj, claim.model):
+            claim.resource = obj
+            break
+
+@event.listens_for(Session, "before_commit")
+def _record_idempotency_key(session):
+    claim = session.info.get("idempotency_claim")
+    if claim is None or claim.recorded:
+        return
+    session.flush()
+    if claim.resource is None:
+        return
+    result = session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == claim.row_id, IdempotencyKey.response.is_(None))
+        .values(response=claim.schema.model_validate(claim.resource).model_dump(mode="json"))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        # The claim timed out and a repeat took the key over; it may be
+        # running the same write, so this one must not commit.
+        raise HTTPException(status_code=409, detail="Idempotency-Key claim expired before the request finished")
+    claim.recorded = True
+
+def request_fingerprint(payload: BaseModel) -> str:
+    body = json.dumps(payload.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+async def run_idempotent(
+    key: Optional[str],
+    scope: str,
+    user_id: int,
+    payload: BaseModel,
+    response: Response,
+    db: AsyncSession,
+    model,
+    schema,
+    call: Callable[[], Awaitable[Any]],
+) -> Any:
+    if key is None:
+        return await call()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+    claim = IdempotencyClaim(scope, user_id, key, request_fingerprint(payload), model, schema)
+    result, replayed = await idempotency_store.run(claim, db, call)
+    if replayed:
+        response.headers[IDEMPOTENCY_REPLAYED_HEADER] = "true"
+    return result
+
+idempotency_store = IdempotencyStore()
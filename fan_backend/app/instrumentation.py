@@ -0,0 +1,186 @@
+import logging
+import os
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+from .metrics import REGISTRY, Metric, format_labels, format_value
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.1"))
+SLOW_QUERY_SAMPLES = int(os.getenv("SLOW_QUERY_SAMPLES", "20"))
+SLOW_QUERY_SQL_LENGTH = 500
+QUERY_COUNT_HEADER = os.getenv("QUERY_COUNT_HEADER", "false").lower() in ("1", "true", "yes")
+QUERY_COUNT_HEADERS = ["X-DB-Query-Count", "X-DB-Time-Ms"]
+
+# Literals that can carry user data (phones, OTP codes, amounts) in statements
+# built with inline values, and the placeholder lists expanded from IN (...).
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_SQL_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "fan_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+REQUEST_QUERIES = REGISTRY.histogram(
+    "fan_http_request_db_queries",
+    "SQL statements executed per HTTP request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+REQUEST_DB_SECONDS = REGISTRY.histogram(
+    "fan_http_request_db_seconds",
+    "Time spent in SQL statements per HTTP request",
+    ["method", "route"],
+)
+QUERY_SECONDS = REGISTRY.histogram(
+    "fan_db_query_duration_seconds",
+    "SQL statement execution time",
+    ["engine"],
+)
+SLOW_QUERIES = REGISTRY.counter(
+    "fan_db_slow_queries_total",
+    "SQL statements slower than SLOW_QUERY_SECONDS",
+    ["route"],
+)
+CACHE_EVENTS = REGISTRY.gauge(
+    "fan_cache_events",
+    "Lookups and evictions per in-process cache since start",
+    ["cache", "event"],
+)
+CACHE_ENTRIES = REGISTRY.gauge(
+    "fan_cache_entries",
+    "Entries currently held per in-process cache",
+    ["cache"],
+)
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+# Mutable per-request counters. Threadpool and run_sync work runs in a copy
+# of the request's context, which still points at the same object.
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+def fingerprint(statement: str) -> str:
+    # The statement's shape with every literal replaced by "?", so slow-query
+    # samples and logs identify the query without exposing its values.
+    statement = _SQL_STRING.sub("?", " ".join(statement.split()))
+    statement = _SQL_NUMBER.sub("?", statement)
+    return _SQL_PLACEHOLDER_LIST.sub("(?, ...)", statement)
+
+class SlowQuerySamples(Metric):
+    # The most recent slow statements, rendered as one gauge sample each
+    # (value = seconds) with the route and truncated SQL fingerprint as labels.
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, maxlen: int):
+        super().__init__(name, documentation, ("route", "statement"))
+        self._samples: Deque[Tuple[str, str, float]] = deque(maxlen=maxlen)
+
+    def record(self, route: str, statement: str, seconds: float) -> str:
+        statement = fingerprint(statement)[:SLOW_QUERY_SQL_LENGTH]
+        with self._lock:
+            self._samples.append((route, statement, seconds))
+        return statement
+
+    def recent(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            return list(self._samples)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, (route, statement))} {format_value(seconds)}"
+            for route, statement, seconds in self.recent()
+        ]
+
+slow_query_samples = REGISTRY.register(SlowQuerySamples(
+    "fan_db_slow_query_sample_seconds",
+    "Recent slow SQL statements",
+    SLOW_QUERY_SAMPLES,
+))
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started_at"].pop()
+    elapsed = time.perf_counter() - started
+    QUERY_SECONDS.observe(elapsed, engine=conn.engine.url.get_backend_name())
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    if elapsed >= SLOW_QUERY_SECONDS:
+        route = stats.route if stats is not None else "background"
+        SLOW_QUERIES.inc(route=route)
+        statement = slow_query_samples.record(route, statement, elapsed)
+        logger.warning("Slow query (%.3fs) on %s: %s", elapsed, route, statement)
+
+def handle_cursor_error(exception_context):
+    # after_cursor_execute never runs for a statement that raised; drop its
+    # start time so the stack stays paired with the statements in flight.
+    conn = exception_context.connection
+    started = conn.info.get("query_started_at") if conn is not None else None
+    if started:
+        started.pop()
+
+def register_cache_metrics(name: str, cache):
+    CACHE_EVENTS.set_function(lambda: cache.hits, cache=name, event="hit")
+    CACHE_EVENTS.set_function(lambda: cache.misses, cache=name, event="miss")
+    CACHE_EVENTS.set_function(lambda: cache.evictions, cache=name, event="eviction")
+    CACHE_ENTRIES.set_function(lambda: len(cache), cache=name)
+
+class RequestMetricsMiddleware:
+    # Pure ASGI middleware (no BaseHTTPMiddleware) so streamed responses
+    # pass through untouched. Latency covers the whole response, including
+    # serialization; the query count in the debug header covers the queries
+    # made before the response headers were sent.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_stats(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if QUERY_COUNT_HEADER:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-DB-Query-Count", str(stats.queries))
+                    headers.append("X-DB-Time-Ms", f"{stats.db_seconds * 1000:.1f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_request_stats.reset(token)
+            route = stats.route
+            method = scope["method"]
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method=method, route=route, status=status_code)
+            REQUEST_QUERIES.observe(stats.queries, method=method, route=route)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, method=method, route=route)
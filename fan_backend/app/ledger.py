@@ -0,0 +1,215 @@
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from .database import dialect_insert
+from .models import CreditAccount, Payment, Transaction, User
+
+logger = logging.getLogger(__name__)
+
+# Advances in these states count against a user's credit until repaid.
+EXPOSURE_STATUSES = ("pending", "completed")
+DRIFT_TOLERANCE = 0.005
+
+class CreditLimitExceeded(Exception):
+    pass
+
+class PaymentRejected(Exception):
+    pass
+
+class CreditLedger:
+    # Maintains credit_accounts.outstanding_balance = open advances - payments,
+    # so a credit check is one conditional UPDATE of a single row instead of
+    # an aggregate over the user's whole history. Callers commit.
+    @staticmethod
+    def _insert_ignore(db: Session, rows: List[dict]):
+        insert = dialect_insert(db)
+        db.execute(insert(CreditAccount).values(rows).on_conflict_do_nothing(index_elements=["user_id"]))
+
+    @staticmethod
+    def compute_exposure(db: Session, user_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+        advances = select(Transaction.user_id, func.sum(Transaction.amount)).where(
+            Transaction.status.in_(EXPOSURE_STATUSES)
+        ).group_by(Transaction.user_id)
+        # Only repayments of advances that still count; an expired advance
+        # released its whole unpaid remainder when it expired.
+        payments = select(Payment.user_id, func.sum(Payment.amount)).join(
+            Transaction, Payment.transaction_id == Transaction.id
+        ).where(
+            Payment.status == "completed",
+            Transaction.status.in_(EXPOSURE_STATUSES)
+        ).group_by(Payment.user_id)
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            advances = advances.where(Transaction.user_id.in_(user_ids))
+            payments = payments.where(Payment.user_id.in_(user_ids))
+
+        exposure: Dict[int, float] = defaultdict(float)
+        for user_id, total in db.execute(advances):
+            exposure[user_id] += total or 0.0
+        for user_id, total in db.execute(payments):
+            exposure[user_id] -= total or 0.0
+        return dict(exposure)
+
+    @staticmethod
+    def open_account(user_id: int, db: Session, balance: Optional[float] = None):
+        if balance is None:
+            balance = CreditLedger.compute_exposure(db, [user_id]).get(user_id, 0.0)
+        CreditLedger._insert_ignore(db, [{"user_id": user_id, "outstanding_balance": balance, "updated_at": datetime.utcnow()}])
+
+    @staticmethod
+    def reserve(user_id: int, amount: float, db: Session):
+        credit_limit = select(User.credit_limit).where(User.id == user_id).scalar_subquery()
+        stmt = (
+            update(CreditAccount)
+            .where(
+                CreditAccount.user_id == user_id,
+                CreditAccount.outstanding_balance + amount <= credit_limit
+            )
+            .values(outstanding_balance=CreditAccount.outstanding_balance + amount, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if db.execute(stmt).rowcount:
+            return
+        if db.get(CreditAccount, user_id) is None:
+            # Users created before the ledger existed get their account
+            # opened from history on first use.
+            CreditLedger.open_account(user_id, db)
+            if db.execute(stmt).rowcount:
+                return
+        raise CreditLimitExceeded(user_id)
+
+    @staticmethod
+    def paid_amounts(transaction_ids: Iterable[int], db: Session) -> Dict[int, float]:
+        return dict(db.execute(
+            select(Payment.transaction_id, func.sum(Payment.amount)).where(
+                Payment.transaction_id.in_(list(transaction_ids)),
+                Payment.status == "completed"
+            ).group_by(Payment.transaction_id)
+        ).all())
+
+    @staticmethod
+    def settle(user_id: int, transaction_id: int, amount: float, db: Session):
+        # Counterpart of reserve for repayments: one conditional UPDATE that
+        # only applies while the advance is still open, the payment fits in
+        # its unpaid remainder and the balance stays non-negative. Callers
+        # add the Payment row afterwards, so it is not part of the remainder.
+        if amount <= 0:
+            raise PaymentRejected("Amount must be positive")
+        paid = select(func.coalesce(func.sum(Payment.amount), 0.0)).where(
+            Payment.transaction_id == transaction_id,
+            Payment.status == "completed"
+        ).scalar_subquery()
+        remainder = select(Transaction.amount - paid).where(
+            Transaction.id == transaction_id,
+            Transaction.user_id == user_id,
+            Transaction.status.in_(EXPOSURE_STATUSES)
+        ).scalar_subquery()
+        stmt = (
+            update(CreditAccount)
+            .where(
+                CreditAccount.user_id == user_id,
+                CreditAccount.outstanding_balance - amount >= -DRIFT_TOLERANCE,
+                amount <= remainder + DRIFT_TOLERANCE
+            )
+            .values(outstanding_balance=CreditAccount.outstanding_balance - amount, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if db.execute(stmt).rowcount:
+            return
+        if db.get(CreditAccount, user_id) is None:
+            CreditLedger.open_account(user_id, db)
+            if db.execute(stmt).rowcount:
+                return
+
+        transaction = db.get(Transaction, transaction_id)
+        if transaction is None or transaction.user_id != user_id or transaction.status not in EXPOSURE_STATUSES:
+            raise PaymentRejected("Transaction is not open for payment")
+        unpaid = transaction.amount - CreditLedger.paid_amounts([transaction_id], db).get(transaction_id, 0.0)
+        if amount > unpaid + DRIFT_TOLERANCE:
+            raise PaymentRejected(f"Amount exceeds the unpaid balance of {max(unpaid, 0.0):.2f}")
+        raise PaymentRejected("Amount exceeds the outstanding balance")
+
+    @staticmethod
+    def adjust(deltas: Dict[int, float], db: Session):
+        # Callers flush the rows behind each delta first. A user without an
+        # account yet is opened from history, which already includes them.
+        deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        existing = set(db.scalars(select(CreditAccount.user_id).where(CreditAccount.user_id.in_(deltas))))
+        for user_id in set(deltas) - existing:
+            CreditLedger.open_account(user_id, db)
+        deltas = {user_id: delta for user_id, delta in deltas.items() if user_id in existing}
+        if not deltas:
+            return
+        db.connection().execute(
+            update(CreditAccount.__table__)
+            .where(CreditAccount.__table__.c.user_id == bindparam("account_user_id"))
+            .values(
+                outstanding_balance=CreditAccount.__table__.c.outstanding_balance + bindparam("delta"),
+                updated_at=datetime.utcnow()
+            ),
+            [{"account_user_id": user_id, "delta": delta} for user_id, delta in deltas.items()]
+        )
+
+    @staticmethod
+    def reconcile(db: Session, fix: bool = True, chunk_size: int = 1000) -> List[dict]:
+        # Recomputes balances from transactions and payments in chunks of
+        # users and reports (optionally corrects) every account that drifted.
+        drift = []
+        last_user_id = 0
+        while True:
+            user_ids = db.scalars(
+                select(User.id).where(User.id > last_user_id).order_by(User.id).limit(chunk_size)
+            ).all()
+            if not user_ids:
+                break
+            last_user_id = user_ids[-1]
+
+            expected = CreditLedger.compute_exposure(db, user_ids)
+            recorded = dict(db.execute(
+                select(CreditAccount.user_id, CreditAccount.outstanding_balance).where(CreditAccount.user_id.in_(user_ids))
+            ).all())
+            corrections = {}
+            for user_id in user_ids:
+                should_be = round(expected.get(user_id, 0.0), 2)
+                actual = recorded.get(user_id)
+                if actual is None and should_be == 0:
+                    continue
+                if actual is None or abs(actual - should_be) > DRIFT_TOLERANCE:
+                    drift.append({"user_id": user_id, "recorded": actual, "expected": should_be})
+                    if actual is not None:
+                        corrections[user_id] = should_be - actual
+                    elif fix:
+                        CreditLedger.open_account(user_id, db, balance=should_be)
+            if fix:
+                CreditLedger.adjust(corrections, db)
+                db.commit()
+
+        if drift:
+            logger.warning("Credit ledger drift on %d accounts", len(drift))
+        return drift
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute credit_accounts balances and report drift")
+    parser.add_argument("--dry-run", action="store_true", help="report drift without correcting it")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from .database import SessionLocal, prepare_schema
+
+    prepare_schema()
+    with SessionLocal() as db:
+        drift = CreditLedger.reconcile(db, fix=not args.dry_run, chunk_size=args.chunk_size)
+    for entry in drift:
+        print(f"user {entry['user_id']}: recorded={entry['recorded']} expected={entry['expected']}")
+    print(f"{len(drift)} account(s) drifted" + (" (not corrected)" if args.dry_run and drift else ""))
+
+if __name__ == "__main__":
+    main()
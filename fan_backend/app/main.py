@@ -1,19 +1,63 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from datetime import timedelta
-from typing import List
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import csv
+import hmac
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Literal, Optional
 
-from .database import get_db, create_tables
+from .background import start_periodic, start_task, stop_all
+from .database import (
+    REPLICA_ENABLED, REPLICA_SYNC_INTERVAL_SECONDS, AsyncSessionLocal, async_engine, async_read_engine, get_async_db,
+    prepare_schema, sync_sqlite_replica
+)
 from .models import User, Transaction, Payment, PartnerStation
 from .schemas import (
     UserCreate, User as UserSchema, PhoneVerificationRequest, 
-    OTPVerificationRequest, LoginRequest, Token, TransactionCreate,
+    OTPVerificationRequest, LoginRequest, RefreshRequest, Token, TransactionCreate,
     Transaction as TransactionSchema, PaymentCreate, Payment as PaymentSchema,
-    PartnerStationCreate, PartnerStation as PartnerStationSchema, QRScanRequest
+    PartnerStationCreate, PartnerStation as PartnerStationSchema, NearbyStation, QRScanRequest,
+    QRScanResponse, QRScanBatchRequest, QRScanBatchResponse, StationImportResult, StationSettlements
+)
+from .auth import (
+    decode_token, get_admin_user, get_current_user, get_user_read_db, issue_tokens, pin_version, token_cache, user_cache,
+    warm_user_cache
+)
+from .catalogue import StationCatalogue, http_date, is_not_modified, station_catalogue
+from .expiry import expiry_scheduler
+from .export import EXPORT_MEDIA_TYPES, build_export_query, stream_export
+from .hashing import password_hasher
+from .idempotency import IDEMPOTENCY_PURGE_INTERVAL_SECONDS, IDEMPOTENCY_REPLAYED_HEADER, idempotency_store, run_idempotent
+from .instrumentation import QUERY_COUNT_HEADERS, RequestMetricsMiddleware, register_cache_metrics
+from .ledger import CreditLimitExceeded, PaymentRejected
+from .metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+from .otp import OTP_SWEEP_INTERVAL_SECONDS, enforce_rate_limit, otp_send_limiter, otp_store, otp_verify_limiter
+from .outbox import OUTBOX_PURGE_INTERVAL_SECONDS, outbox_dispatcher
+from .pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, PAGINATION_HEADERS, filter_by_status_and_date, finish_page, keyset_page,
+    page_headers,
+)
+from .replica import (
+    LAST_WRITE_HEADER, REPLICA_HEARTBEAT_SECONDS, LastWriteMiddleware, get_async_read_db, replica_monitor
 )
-from .auth import create_access_token, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
-from .services import AuthService, TransactionService, PaymentService, StationService
+from .services import (
+    AuthService, TransactionService, PaymentService, StationService, QR_IMAGE_MEDIA_TYPES, STATION_IMPORT_MAX_ROWS,
+    qr_image_cache
+)
+from .serialization import payment_rows, station_rows, transaction_rows
+from .settlements import SETTLEMENT_MAX_DAYS, SettlementRollup
+from .velocity import VELOCITY_CHECKS, VELOCITY_EVICT_INTERVAL_SECONDS, VelocityLimitExceeded, velocity_tracker
+
+CACHE_WARMUP = os.getenv("CACHE_WARMUP", "true").lower() in ("1", "true", "yes")
+# Bearer token a scraper must send to read /metrics; unset leaves it open,
+# for deployments where the endpoint is only reachable on a private network.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 app = FastAPI(title="Fuel Advance Network API", version="1.0.0")
 
@@ -23,37 +67,108 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=PAGINATION_HEADERS + [IDEMPOTENCY_REPLAYED_HEADER, LAST_WRITE_HEADER] + QUERY_COUNT_HEADERS,
 )
+app.add_middleware(RequestMetricsMiddleware)
+if REPLICA_ENABLED:
+    app.add_middleware(LastWriteMiddleware)
+
+register_cache_metrics("user", user_cache)
+register_cache_metrics("token", token_cache)
+register_cache_metrics("qr_image", qr_image_cache)
+
+async def purge_expired_otps():
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(otp_store.purge_expired)
+
+async def purge_outbox():
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(outbox_dispatcher.purge)
+
+async def purge_idempotency_keys():
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(idempotency_store.purge_expired)
+
+async def evict_idle_velocity_windows():
+    await asyncio.to_thread(velocity_tracker.evict_idle)
+
+async def sync_replica():
+    await asyncio.to_thread(sync_sqlite_replica)
+
+async def warm_caches():
+    # Runs after startup so the first requests do not pay for the station
+    # index, the /stations snapshot, recently active users' lookups and
+    # per-user velocity windows.
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(StationService.load_station_index)
+        await db.run_sync(station_catalogue.get)
+        await db.run_sync(warm_user_cache)
+        await db.run_sync(velocity_tracker.hydrate)
 
 @app.on_event("startup")
-def startup_event():
-    create_tables()
+async def startup_event():
+    prepare_schema()
+    if REPLICA_SYNC_INTERVAL_SECONDS > 0:
+        # The first copy runs before serving so the replica has the schema.
+        sync_sqlite_replica()
+        start_periodic("replica-sync", REPLICA_SYNC_INTERVAL_SECONDS, sync_replica)
+    if REPLICA_ENABLED:
+        start_periodic("replica-heartbeat", REPLICA_HEARTBEAT_SECONDS, replica_monitor.tick)
+    password_hasher.start()
+    start_periodic("otp-sweeper", OTP_SWEEP_INTERVAL_SECONDS, purge_expired_otps)
+    start_task("transaction-expiry", expiry_scheduler.run())
+    start_task("outbox-dispatcher", outbox_dispatcher.run())
+    start_periodic("outbox-purge", OUTBOX_PURGE_INTERVAL_SECONDS, purge_outbox)
+    start_periodic("idempotency-purge", IDEMPOTENCY_PURGE_INTERVAL_SECONDS, purge_idempotency_keys)
+    if VELOCITY_CHECKS:
+        start_periodic("velocity-evict", VELOCITY_EVICT_INTERVAL_SECONDS, evict_idle_velocity_windows)
+    if CACHE_WARMUP:
+        start_task("cache-warmup", warm_caches())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_all()
+    password_hasher.shutdown()
+    await async_engine.dispose()
+    await async_read_engine.dispose()
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Fuel Advance Network API", "version": "1.0.0"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(content=REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.post("/auth/send-otp")
-def send_otp(request: PhoneVerificationRequest, db: Session = Depends(get_db)):
-    success = AuthService.send_otp(request.phone, db)
+async def send_otp(request: PhoneVerificationRequest, db: AsyncSession = Depends(get_async_db)):
+    enforce_rate_limit(otp_send_limiter, request.phone)
+    success = await AuthService.send_otp_async(request.phone, db)
     if success:
         return {"message": "OTP sent successfully"}
     raise HTTPException(status_code=400, detail="Failed to send OTP")
 
 @app.post("/auth/verify-otp")
-def verify_otp(request: OTPVerificationRequest, db: Session = Depends(get_db)):
-    is_valid = AuthService.verify_otp(request.phone, request.otp_code, db)
+async def verify_otp(request: OTPVerificationRequest, db: AsyncSession = Depends(get_async_db)):
+    enforce_rate_limit(otp_verify_limiter, request.phone)
+    is_valid = await AuthService.verify_otp_async(request.phone, request.otp_code, db)
     if is_valid:
         return {"message": "OTP verified successfully", "verified": True}
     raise HTTPException(status_code=400, detail="Invalid or expired OTP")
 
 @app.post("/auth/register", response_model=Token)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.phone == user.phone).first()
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await AuthService.get_user_by_phone_async(user.phone, db)
     if existing_user:
         raise HTTPException(status_code=400, detail="Phone number already registered")
     
-    new_user = AuthService.create_user(
+    new_user = await AuthService.create_user_async(
         phone=user.phone,
         first_name=user.first_name,
         last_name=user.last_name,
@@ -61,73 +176,126 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         db=db
     )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": new_user.phone}, expires_delta=access_token_expires
-    )
-    
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": new_user
-    }
+    return issue_tokens(new_user)
 
 @app.post("/auth/login", response_model=Token)
-def login_user(login_data: LoginRequest, db: Session = Depends(get_db)):
-    user = AuthService.authenticate_user(login_data.phone, login_data.pin, db)
+async def login_user(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await AuthService.authenticate_user_async(login_data.phone, login_data.pin, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect phone number or PIN"
         )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.phone}, expires_delta=access_token_expires
-    )
+    return issue_tokens(user)
+
+@app.post("/auth/refresh", response_model=Token)
+async def refresh_tokens(request: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    claims = decode_token(request.refresh_token, token_type="refresh")
+    user = await AuthService.get_user_by_phone_async(claims["sub"], db)
+    if not user or claims.get("pv") != pin_version(user.pin_hash):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": user
-    }
+    return issue_tokens(user)
 
 @app.get("/auth/me", response_model=UserSchema)
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
 @app.post("/transactions/create", response_model=TransactionSchema)
-def create_advance_request(
+async def create_advance_request(
     transaction_data: TransactionCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if transaction_data.amount > current_user.credit_limit:
-        raise HTTPException(status_code=400, detail="Amount exceeds credit limit")
+    if transaction_data.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
     
-    transaction = TransactionService.create_advance_request(
-        user_id=current_user.id,
-        amount=transaction_data.amount,
-        station_id=transaction_data.station_id,
-        db=db
-    )
+    async def create():
+        try:
+            transaction = await TransactionService.create_advance_request_async(
+                user_id=current_user.id,
+                amount=transaction_data.amount,
+                station_id=transaction_data.station_id,
+                db=db
+            )
+        except CreditLimitExceeded:
+            raise HTTPException(status_code=400, detail="Amount exceeds credit limit")
+        except VelocityLimitExceeded:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many advance requests, please try again later",
+            )
+        
+        expiry_scheduler.notify(transaction.expires_at)
+        return TransactionSchema.model_validate(transaction)
     
-    return transaction
+    return await run_idempotent(
+        idempotency_key, "transactions/create", current_user.id, transaction_data, response,
+        db, Transaction, TransactionSchema, create
+    )
 
 @app.get("/transactions/my", response_model=List[TransactionSchema])
-def get_user_transactions(
+async def get_user_transactions(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_read_db)
 ):
-    transactions = db.query(Transaction).filter(Transaction.user_id == current_user.id).all()
-    return transactions
+    query = transaction_rows.select().where(Transaction.user_id == current_user.id)
+    query = filter_by_status_and_date(query, Transaction, status_filter, created_from, created_to)
+    transactions = (await db.execute(keyset_page(query, Transaction, cursor, limit))).all()
+    return transaction_rows.response(finish_page(transactions, limit, response), page_headers(response))
 
-@app.post("/transactions/scan-qr")
-def scan_qr_code(
+@app.get("/transactions/{transaction_id}/qr.{image_format}")
+async def get_transaction_qr_image(
+    transaction_id: int,
+    image_format: Literal["png", "svg"],
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_user_read_db)
+):
+    row = (await db.execute(
+        select(Transaction.qr_code, Transaction.status, Transaction.expires_at).where(
+            Transaction.id == transaction_id,
+            Transaction.user_id == current_user.id
+        )
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    qr_code, transaction_status, expires_at = row
+    remaining = int((expires_at - datetime.utcnow()).total_seconds())
+    if transaction_status != "pending" or remaining <= 0:
+        TransactionService.evict_qr_images(qr_code)
+        raise HTTPException(status_code=410, detail="QR code is no longer valid")
+    
+    headers = {
+        "ETag": TransactionService.qr_image_etag(qr_code, image_format),
+        "Cache-Control": f"private, max-age={remaining}",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    image = await run_in_threadpool(TransactionService.get_qr_image, qr_code, image_format, expires_at)
+    return Response(content=image, media_type=QR_IMAGE_MEDIA_TYPES[image_format], headers=headers)
+
+@app.post("/transactions/scan-qr", response_model=QRScanResponse)
+async def scan_qr_code(
     scan_data: QRScanRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    transaction = TransactionService.validate_qr_scan(
+    transaction = await TransactionService.validate_qr_scan_async(
         qr_code=scan_data.qr_code,
         station_id=scan_data.station_id,
         db=db
@@ -138,49 +306,95 @@ def scan_qr_code(
     
     return {"message": "QR code scanned successfully", "transaction": transaction}
 
+@app.post("/transactions/scan-qr/batch", response_model=QRScanBatchResponse)
+async def scan_qr_code_batch(
+    batch: QRScanBatchRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    results = await TransactionService.redeem_qr_batch_async(
+        scans=[(scan.qr_code, scan.station_id) for scan in batch.scans],
+        db=db
+    )
+    return {"results": results}
+
 @app.post("/payments/create", response_model=PaymentSchema)
-def create_payment(
+async def create_payment(
     payment_data: PaymentCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    transaction = db.query(Transaction).filter(
-        Transaction.id == payment_data.transaction_id,
-        Transaction.user_id == current_user.id
-    ).first()
+    if payment_data.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
     
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+    async def create():
+        transaction = await db.scalar(select(Transaction).where(
+            Transaction.id == payment_data.transaction_id,
+            Transaction.user_id == current_user.id
+        ))
+        
+        if not transaction:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        
+        try:
+            payment = await PaymentService.process_payment_async(
+                transaction_id=payment_data.transaction_id,
+                user_id=current_user.id,
+                amount=payment_data.amount,
+                method=payment_data.method,
+                db=db
+            )
+        except PaymentRejected as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        return PaymentSchema.model_validate(payment)
     
-    payment = PaymentService.process_payment(
-        transaction_id=payment_data.transaction_id,
-        user_id=current_user.id,
-        amount=payment_data.amount,
-        method=payment_data.method,
-        db=db
+    return await run_idempotent(
+        idempotency_key, "payments/create", current_user.id, payment_data, response,
+        db, Payment, PaymentSchema, create
     )
-    
-    return payment
 
 @app.get("/payments/my", response_model=List[PaymentSchema])
-def get_user_payments(
+async def get_user_payments(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_read_db)
 ):
-    payments = db.query(Payment).filter(Payment.user_id == current_user.id).all()
-    return payments
+    query = payment_rows.select().where(Payment.user_id == current_user.id)
+    query = filter_by_status_and_date(query, Payment, status_filter, created_from, created_to)
+    payments = (await db.execute(keyset_page(query, Payment, cursor, limit))).all()
+    return payment_rows.response(finish_page(payments, limit, response), page_headers(response))
 
 @app.get("/stations", response_model=List[PartnerStationSchema])
-def get_partner_stations(db: Session = Depends(get_db)):
-    stations = db.query(PartnerStation).filter(PartnerStation.status == "active").all()
-    return stations
+async def get_partner_stations(
+    request: Request,
+    since: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    if since is not None:
+        # Delta sync: stations changed after `since`, inactive ones included.
+        stations = await db.run_sync(lambda session: StationCatalogue.changed_since(session, since))
+        return station_rows.response(stations)
+    
+    snapshot = station_catalogue.current() or await db.run_sync(station_catalogue.get)
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if snapshot.last_modified is not None:
+        headers["Last-Modified"] = http_date(snapshot.last_modified)
+    if is_not_modified(snapshot, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
 @app.post("/stations/create", response_model=PartnerStationSchema)
-def create_partner_station(
+async def create_partner_station(
     station_data: PartnerStationCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    station = StationService.create_station(
+    station = await StationService.create_station_async(
         name=station_data.name,
         address=station_data.address,
         latitude=station_data.latitude,
@@ -192,12 +406,91 @@ def create_partner_station(
     )
     return station
 
-@app.get("/stations/nearby")
-def get_nearby_stations(
-    latitude: float,
-    longitude: float,
-    radius: float = 10.0,
-    db: Session = Depends(get_db)
+@app.post("/stations/bulk", response_model=StationImportResult)
+async def bulk_import_stations(
+    request: Request,
+    admin: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Accepts a JSON array, a text/csv body, or a multipart upload in "file".
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    is_csv = content_type == "text/csv"
+    if content_type == "multipart/form-data":
+        upload = (await request.form()).get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected a file field")
+        is_csv = not (upload.filename or "").lower().endswith(".json")
+        body = await upload.read()
+    elif is_csv or content_type in ("application/json", ""):
+        body = await request.body()
+    else:
+        raise HTTPException(status_code=415, detail="Send JSON or CSV")
+    
+    try:
+        text = body.decode("utf-8-sig")
+        records = StationService.parse_station_csv(text) if is_csv else json.loads(text)
+    except (UnicodeDecodeError, ValueError, csv.Error):
+        raise HTTPException(status_code=400, detail="Could not parse the upload")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Expected a list of stations")
+    if len(records) > STATION_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {STATION_IMPORT_MAX_ROWS} stations per upload")
+    
+    rows, errors = StationService.validate_station_rows(records)
+    created, updated = await StationService.bulk_upsert_stations_async(rows, db)
+    return {"created": created, "updated": updated, "errors": errors}
+
+@app.get("/stations/{station_id}/settlements", response_model=StationSettlements)
+async def get_station_settlements(
+    station_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    admin: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    stations = StationService.find_nearby_stations(latitude, longitude, radius, db)
+    # Days are UTC and both bounds are inclusive; defaults to the last 30 days.
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to or (date_to - date_from).days >= SETTLEMENT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must be 1 to {SETTLEMENT_MAX_DAYS} days")
+    if await db.get(PartnerStation, station_id) is None:
+        raise HTTPException(status_code=404, detail="Station not found")
+    
+    days = await db.run_sync(lambda session: SettlementRollup.daily(station_id, date_from, date_to, session))
+    return {
+        "station_id": station_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "redeemed_count": sum(day.redeemed_count for day in days),
+        "redeemed_amount": round(sum(day.redeemed_amount for day in days), 2),
+        "days": days
+    }
+
+@app.get("/stations/nearby", response_model=List[NearbyStation])
+async def get_nearby_stations(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius: float = Query(10.0, gt=0),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    stations = await StationService.find_nearby_stations_async(latitude, longitude, radius, db, limit=limit)
     return stations
+
+@app.get("/admin/exports/{dataset}")
+async def export_dataset(
+    dataset: Literal["transactions", "payments"],
+    export_format: Literal["csv", "ndjson"] = Query("ndjson", alias="format"),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    station_id: Optional[int] = None,
+    admin: User = Depends(get_admin_user)
+):
+    stmt = build_export_query(dataset, status_filter, created_from, created_to, station_id)
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%dT%H%M%S}.{export_format}"
+    return StreamingResponse(
+        stream_export(stmt, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, Boolean, Text, ForeignKey, Index, JSON, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -27,6 +27,7 @@ class User(Base):
     
     transactions = relationship("Transaction", back_populates="user")
     payments = relationship("Payment", back_populates="user")
+    credit_account = relationship("CreditAccount", back_populates="user", uselist=False)
 
 class PartnerStation(Base):
     __tablename__ = "partner_stations"
@@ -40,6 +41,7 @@ class PartnerStation(Base):
     contact_email = Column(String(100))
     operating_hours = Column(String(100))
     status = Column(String(20), default="active")
+    external_id = Column(String(64), unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -61,6 +63,14 @@ class Transaction(Base):
     user = relationship("User", back_populates="transactions")
     station = relationship("PartnerStation", back_populates="transactions")
     payments = relationship("Payment", back_populates="transaction")
+    
+    __table_args__ = (
+        Index("ix_transactions_user_id_created_at", "user_id", "created_at"),
+        Index("ix_transactions_qr_code_status_expires_at", "qr_code", "status", "expires_at"),
+        Index("ix_transactions_status_expires_at", "status", "expires_at"),
+        Index("ix_transactions_created_at", "created_at"),
+        Index("ix_transactions_completed_at", "completed_at"),
+    )
 
 class Payment(Base):
     __tablename__ = "payments"
@@ -77,6 +87,12 @@ class Payment(Base):
     
     transaction = relationship("Transaction", back_populates="payments")
     user = relationship("User", back_populates="payments")
+    
+    __table_args__ = (
+        Index("ix_payments_user_id_created_at", "user_id", "created_at"),
+        Index("ix_payments_created_at", "created_at"),
+        Index("ix_payments_transaction_id", "transaction_id"),
+    )
 
 class OTPVerification(Base):
     __tablename__ = "otp_verifications"
@@ -88,3 +104,75 @@ class OTPVerification(Base):
     verified = Column(Boolean, default=False)
     expires_at = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_otp_verifications_phone_purpose_expires_at", "phone", "purpose", "expires_at"),
+    )
+
+class CreditAccount(Base):
+    __tablename__ = "credit_accounts"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    outstanding_balance = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    user = relationship("User", back_populates="credit_account")
+
+class StationDailyRollup(Base):
+    __tablename__ = "station_daily_rollup"
+    
+    station_id = Column(Integer, ForeignKey("partner_stations.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    redeemed_count = Column(Integer, nullable=False, default=0)
+    redeemed_amount = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox_messages"
+    
+    id = Column(Integer, primary_key=True)
+    channel = Column(String(20), nullable=False, default="sms")
+    kind = Column(String(50), nullable=False)
+    # Either a fixed recipient or a user whose phone is looked up at send time.
+    recipient = Column(String(100))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+    provider = Column(String(50))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_outbox_messages_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+class ReplicaHeartbeat(Base):
+    __tablename__ = "replica_heartbeat"
+    
+    # A single row bumped on the primary; how far it has reached on the read
+    # replica tells which commits the replica already has.
+    id = Column(Integer, primary_key=True)
+    position = Column(BigInteger, nullable=False, default=0)
+    beat_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    # Committed with no response before the write runs, so a concurrent
+    # repeat finds the key claimed; the response is filled in by the same
+    # transaction as the row the write created.
+    id = Column(Integer, primary_key=True)
+    scope = Column(String(50), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    response = Column(JSON)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("scope", "user_id", "key", name="uq_idempotency_keys_scope_user_id_key"),
+        Index("ix_idempotency_keys_created_at", "created_at"),
+    )
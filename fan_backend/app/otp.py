@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .models import OTPVerification
+
+OTP_STORE = os.getenv("OTP_STORE", "db")
+OTP_SWEEP_INTERVAL_SECONDS = float(os.getenv("OTP_SWEEP_INTERVAL_SECONDS", "300"))
+OTP_SWEEP_BATCH_SIZE = int(os.getenv("OTP_SWEEP_BATCH_SIZE", "1000"))
+OTP_SEND_LIMIT = int(os.getenv("OTP_SEND_LIMIT", "3"))
+OTP_SEND_WINDOW_SECONDS = float(os.getenv("OTP_SEND_WINDOW_SECONDS", "600"))
+OTP_VERIFY_LIMIT = int(os.getenv("OTP_VERIFY_LIMIT", "5"))
+OTP_VERIFY_WINDOW_SECONDS = float(os.getenv("OTP_VERIFY_WINDOW_SECONDS", "300"))
+
+class OTPStore(ABC):
+    # Interface for OTP persistence. `db` is the caller's session; save and
+    # consume leave committing it to the caller, stores that keep state
+    # elsewhere ignore it.
+    @abstractmethod
+    def save(self, phone: str, otp_code: str, purpose: str, expires_at: datetime, db: Session):
+        pass
+
+    @abstractmethod
+    def consume(self, phone: str, otp_code: str, purpose: str, db: Session) -> bool:
+        pass
+
+    @abstractmethod
+    def purge_expired(self, db: Session) -> int:
+        pass
+
+class DatabaseOTPStore(OTPStore):
+    def __init__(self, batch_size: int = OTP_SWEEP_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def save(self, phone: str, otp_code: str, purpose: str, expires_at: datetime, db: Session):
+        db.add(OTPVerification(phone=phone, otp_code=otp_code, purpose=purpose, expires_at=expires_at))
+
+    def consume(self, phone: str, otp_code: str, purpose: str, db: Session) -> bool:
+        # Conditional UPDATE on the (phone, purpose, expires_at) index: marks
+        # the code used and reports whether it was valid in one statement.
+        result = db.execute(
+            update(OTPVerification)
+            .where(
+                OTPVerification.phone == phone,
+                OTPVerification.purpose == purpose,
+                OTPVerification.expires_at > datetime.utcnow(),
+                OTPVerification.otp_code == otp_code,
+                OTPVerification.verified == False
+            )
+            .values(verified=True)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount > 0
+
+    def purge_expired(self, db: Session) -> int:
+        now = datetime.utcnow()
+        deleted = 0
+        while True:
+            expired_ids = select(OTPVerification.id).where(OTPVerification.expires_at <= now).limit(self.batch_size)
+            result = db.execute(
+                delete(OTPVerification)
+                .where(OTPVerification.id.in_(expired_ids.scalar_subquery()))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            deleted += result.rowcount
+            if result.rowcount < self.batch_size:
+                return deleted
+
+class MemoryOTPStore(OTPStore):
+    # Single-process store: only the latest code per (phone, purpose) is kept,
+    # and entries drop out once they expire.
+    def __init__(self):
+        self._codes: Dict[Tuple[str, str], Tuple[str, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def save(self, phone: str, otp_code: str, purpose: str, expires_at: datetime, db: Session = None):
+        with self._lock:
+            self._codes[(phone, purpose)] = (otp_code, expires_at)
+
+    def consume(self, phone: str, otp_code: str, purpose: str, db: Session = None) -> bool:
+        with self._lock:
+            entry = self._codes.get((phone, purpose))
+            if entry is None or entry[0] != otp_code or entry[1] <= datetime.utcnow():
+                return False
+            del self._codes[(phone, purpose)]
+            return True
+
+    def purge_expired(self, db: Session = None) -> int:
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._codes.items() if expires_at <= now]
+            for key in expired:
+                del self._codes[key]
+        return len(expired)
+
+class RateLimiter:
+    # Fixed-window counter per key: one dict lookup per check, no history scan.
+    def __init__(self, limit: int, window_seconds: float, maxsize: int = 100_000):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._windows = TTLCache(maxsize=maxsize, ttl_seconds=window_seconds)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> Optional[float]:
+        # Returns None if allowed, otherwise seconds until the window resets.
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key, count=False)
+            if window is None:
+                self._windows.set(key, [now, 1])
+                return None
+            if window[1] >= self.limit:
+                return max(0.0, window[0] + self.window_seconds - now)
+            window[1] += 1
+            return None
+
+def enforce_rate_limit(limiter: RateLimiter, key: str):
+    retry_after = limiter.hit(key)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+def build_otp_store(kind: str = OTP_STORE) -> OTPStore:
+    if kind == "memory":
+        return MemoryOTPStore()
+    return DatabaseOTPStore()
+
+otp_store = build_otp_store()
+otp_send_limiter = RateLimiter(OTP_SEND_LIMIT, OTP_SEND_WINDOW_SECONDS)
+otp_verify_limiter = RateLimiter(OTP_VERIFY_LIMIT, OTP_VERIFY_WINDOW_SECONDS)
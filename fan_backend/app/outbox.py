@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.orm import Session
+
+from .database import AsyncSessionLocal
+from .metrics import REGISTRY
+from .models import OutboxMessage, User
+
+logger = logging.getLogger(__name__)
+
+SMS_PROVIDER = os.getenv("SMS_PROVIDER", "console")
+SMS_RATE_PER_SECOND = float(os.getenv("SMS_RATE_PER_SECOND", "10"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "2"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "900"))
+# A claimed message is retried after this long if its worker never reports back.
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_MAX_SLEEP_SECONDS = float(os.getenv("OUTBOX_MAX_SLEEP_SECONDS", "30"))
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "72"))
+OUTBOX_PURGE_INTERVAL_SECONDS = float(os.getenv("OUTBOX_PURGE_INTERVAL_SECONDS", "3600"))
+OUTBOX_ERROR_LENGTH = 500
+# Kinds whose payload is a secret: it is blanked as soon as the message is
+# sent or fails for good, instead of lasting until the retention purge.
+REDACTED_KINDS = ("otp",)
+
+MESSAGE_TEMPLATES = {
+    "otp": "Your FAN verification code is {otp_code}. It expires in 5 minutes.",
+    "payment_receipt": "FAN: payment of NGN {amount:,.2f} received for advance #{transaction_id}. Ref {reference}.",
+    "redemption_receipt": "FAN: your NGN {amount:,.2f} fuel advance #{transaction_id} was redeemed at station #{station_id}.",
+}
+
+OUTBOX_SENT = REGISTRY.counter(
+    "fan_outbox_sent_total",
+    "Outbox messages delivered to a provider",
+    ["provider", "kind"],
+)
+OUTBOX_FAILURES = REGISTRY.counter(
+    "fan_outbox_failures_total",
+    "Outbox delivery attempts that failed, by outcome (retry or failed)",
+    ["provider", "outcome"],
+)
+OUTBOX_SEND_SECONDS = REGISTRY.histogram(
+    "fan_outbox_send_seconds",
+    "Provider call time per message, including rate-limit waits",
+    ["provider"],
+)
+OUTBOX_DELIVERY_LAG_SECONDS = REGISTRY.histogram(
+    "fan_outbox_delivery_lag_seconds",
+    "Time from enqueue to delivery",
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0),
+)
+
+class PermanentSendError(Exception):
+    # Raised by a sender when retrying cannot help (e.g. invalid number).
+    pass
+
+class OutgoingMessage(NamedTuple):
+    id: int
+    kind: str
+    recipient: str
+    body: str
+
+class NotificationSender:
+    # Interface for delivery providers. send() raises on failure; anything
+    # other than PermanentSendError is retried with backoff.
+    name = "base"
+
+    def __init__(self, rate_per_second: float = SMS_RATE_PER_SECOND):
+        self.rate_per_second = rate_per_second
+
+    async def send(self, message: OutgoingMessage):
+        raise NotImplementedError
+
+class ConsoleSender(NotificationSender):
+    # Development provider: prints the message, as send_otp used to.
+    name = "console"
+
+    async def send(self, message: OutgoingMessage):
+        print(f"SMS to {message.recipient}: {message.body}")
+
+class FakeSender(NotificationSender):
+    # In-memory provider for tests and benchmarks. `latency` simulates the
+    # provider round trip; `fail_first` fails that many calls before
+    # succeeding.
+    name = "fake"
+
+    def __init__(self, rate_per_second: float = 0, latency: float = 0.0, fail_first: int = 0):
+        super().__init__(rate_per_second)
+        self.latency = latency
+        self.fail_first = fail_first
+        self.sent: List[OutgoingMessage] = []
+
+    async def send(self, message: OutgoingMessage):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_first > 0:
+            self.fail_first -= 1
+            raise ConnectionError("fake provider failure")
+        self.sent.append(message)
+
+SENDERS: Dict[str, Callable[[], NotificationSender]] = {
+    "console": ConsoleSender,
+    "fake": FakeSender,
+}
+
+def register_sender(name: str, factory: Callable[[], NotificationSender]):
+    SENDERS[name] = factory
+
+def build_sender(name: str = SMS_PROVIDER) -> NotificationSender:
+    if name not in SENDERS:
+        raise RuntimeError(f"Unknown SMS_PROVIDER {name!r}")
+    return SENDERS[name]()
+
+class TokenBucket:
+    # Async rate limiter: acquire() waits until a token is available. A rate
+    # of 0 means unlimited.
+    def __init__(self, rate_per_second: float, burst: Optional[float] = None):
+        self.rate = rate_per_second
+        self.capacity = burst or max(1.0, rate_per_second)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def enqueue(db: Session, kind: str, payload: dict, user_id: Optional[int] = None,
+            recipient: Optional[str] = None, channel: str = "sms") -> OutboxMessage:
+    # Adds the message to the caller's session; it becomes visible to the
+    # dispatcher only if the caller's transaction commits.
+    message = OutboxMessage(channel=channel, kind=kind, payload=payload, user_id=user_id, recipient=recipient,
+                            next_attempt_at=datetime.utcnow())
+    db.add(message)
+    db.info["outbox_enqueued"] = True
+    return message
+
+def retry_delay(attempts: int) -> float:
+    # Exponential backoff with jitter in [delay / 2, delay].
+    delay = min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+class OutboxDispatcher:
+    # Drains outbox_messages in the background. A batch is claimed with one
+    # conditional UPDATE that pushes next_attempt_at out by the lease, so
+    # several workers can dispatch side by side and a message held by a
+    # worker that died is picked up again once its lease runs out. Messages
+    # are sent with bounded concurrency and a token bucket per provider, and
+    # outcomes are written back in one transaction per batch.
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, concurrency: int = OUTBOX_CONCURRENCY,
+                 max_sleep_seconds: float = OUTBOX_MAX_SLEEP_SECONDS):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_sleep_seconds = max_sleep_seconds
+        self.senders: Dict[str, NotificationSender] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def sender(self, channel: str) -> NotificationSender:
+        if channel not in self.senders:
+            self.senders[channel] = build_sender()
+        return self.senders[channel]
+
+    def _bucket(self, sender: NotificationSender) -> TokenBucket:
+        if sender.name not in self._buckets:
+            self._buckets[sender.name] = TokenBucket(sender.rate_per_second)
+        return self._buckets[sender.name]
+
+    def claim(self, db: Session, now: Optional[datetime] = None) -> List[Tuple[OutboxMessage, Optional[str]]]:
+        now = now or datetime.utcnow()
+        due_ids = (
+            select(OutboxMessage.id)
+            .where(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now)
+            .order_by(OutboxMessage.next_attempt_at)
+            .limit(self.batch_size)
+        )
+        claimed = db.scalars(
+            update(OutboxMessage)
+            .where(
+                OutboxMessage.id.in_(due_ids.scalar_subquery()),
+                OutboxMessage.status == "pending",
+                OutboxMessage.next_attempt_at <= now,
+            )
+            .values(next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS), attempts=OutboxMessage.attempts + 1)
+            .returning(OutboxMessage)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        ).all()
+        user_ids = {message.user_id for message in claimed if message.recipient is None and message.user_id is not None}
+        phones = dict(db.execute(select(User.id, User.phone).where(User.id.in_(user_ids))).all()) if user_ids else {}
+        db.commit()
+        return [(message, message.recipient or phones.get(message.user_id)) for message in claimed]
+
+    async def _deliver(self, message: OutboxMessage, recipient: Optional[str], semaphore: asyncio.Semaphore) -> dict:
+        sender = self.sender(message.channel)
+        outcome = {"id": message.id, "provider": sender.name}
+        try:
+            if recipient is None:
+                raise PermanentSendError("no recipient")
+            body = MESSAGE_TEMPLATES[message.kind].format(**message.payload)
+            async with semaphore:
+                started = time.perf_counter()
+                await self._bucket(sender).acquire()
+                await sender.send(OutgoingMessage(message.id, message.kind, recipient, body))
+                OUTBOX_SEND_SECONDS.observe(time.perf_counter() - started, provider=sender.name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            permanent = isinstance(exc, (PermanentSendError, KeyError)) or message.attempts >= OUTBOX_MAX_ATTEMPTS
+            outcome.update(
+                status="failed" if permanent else "pending",
+                last_error=f"{type(exc).__name__}: {exc}"[:OUTBOX_ERROR_LENGTH],
+                next_attempt_at=datetime.utcnow() + timedelta(seconds=0 if permanent else retry_delay(message.attempts)),
+            )
+            OUTBOX_FAILURES.inc(provider=sender.name, outcome="failed" if permanent else "retry")
+            if permanent:
+                logger.warning("Outbox message %s failed permanently: %s", message.id, outcome["last_error"])
+                if message.kind in REDACTED_KINDS:
+                    outcome["payload"] = {}
+            return outcome
+        now = datetime.utcnow()
+        OUTBOX_SENT.inc(provider=sender.name, kind=message.kind)
+        if message.created_at is not None:
+            OUTBOX_DELIVERY_LAG_SECONDS.observe((now - message.created_at).total_seconds())
+        outcome.update(status="sent", sent_at=now, last_error=None)
+        if message.kind in REDACTED_KINDS:
+            outcome["payload"] = {}
+        return outcome
+
+    def record(self, db: Session, outcomes: List[dict]):
+        if outcomes:
+            db.execute(update(OutboxMessage), outcomes)
+            db.commit()
+
+    def next_due(self, db: Session) -> Optional[datetime]:
+        return db.scalar(select(func.min(OutboxMessage.next_attempt_at)).where(OutboxMessage.status == "pending"))
+
+    def purge(self, db: Session) -> int:
+        cutoff = datetime.utcnow() - timedelta(hours=OUTBOX_RETENTION_HOURS)
+        result = db.execute(
+            delete(OutboxMessage)
+            .where(OutboxMessage.status.in_(("sent", "failed")), OutboxMessage.created_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+
+    async def dispatch_batch(self) -> int:
+        async with AsyncSessionLocal() as db:
+            claimed = await db.run_sync(self.claim)
+        if not claimed:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        outcomes = await asyncio.gather(*(self._deliver(message, recipient, semaphore) for message, recipient in claimed))
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(lambda session: self.record(session, list(outcomes)))
+        return len(claimed)
+
+    def notify(self):
+        # Called after a commit that enqueued messages; safe from any thread.
+        if self._wake is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _sleep(self, delay: float):
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            # Cleared before draining, so a commit that lands mid-batch still
+            # wakes the next sleep.
+            self._wake.clear()
+            try:
+                dispatched = await self.dispatch_batch()
+                if dispatched >= self.batch_size:
+                    await asyncio.sleep(0)
+                    continue
+                async with AsyncSessionLocal() as db:
+                    due = await db.run_sync(self.next_due)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                due = None
+            delay = self.max_sleep_seconds
+            if due is not None:
+                delay = min(delay, max(0.0, (due - datetime.utcnow()).total_seconds()))
+            await self._sleep(delay)
+
+outbox_dispatcher = OutboxDispatcher()
+
+@event.listens_for(Session, "after_commit")
+def _wake_outbox_dispatcher(session):
+    if session.info.pop("outbox_enqueued", False):
+        outbox_dispatcher.notify()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_outbox_wakeup(session):
+    session.info.pop("outbox_enqueued", None)
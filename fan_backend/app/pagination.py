@@ -0,0 +1,75 @@
+import base64
+import binascii
+from datetime import datetime, timezone
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import Select, and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+PAGINATION_HEADERS = ["X-Next-Cursor", "X-Has-More"]
+
+# Keyset pagination over (created_at, id), newest first. The cursor is the
+# position of the last row returned, so each page is an index range scan on
+# (user_id, created_at) instead of an OFFSET that re-reads earlier pages.
+# A request without a limit gets the first DEFAULT_PAGE_SIZE rows, so no
+# list endpoint returns a user's whole history in one response.
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def naive_utc(value: datetime) -> datetime:
+    # created_at is stored as naive UTC; an offset-aware bound has to be
+    # converted, not just have its offset dropped.
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def filter_by_status_and_date(
+    stmt: Select,
+    model,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+) -> Select:
+    if status is not None:
+        stmt = stmt.where(model.status == status)
+    if created_from is not None:
+        stmt = stmt.where(model.created_at >= naive_utc(created_from))
+    if created_to is not None:
+        stmt = stmt.where(model.created_at < naive_utc(created_to))
+    return stmt
+
+def keyset_page(stmt: Select, model, cursor: Optional[str], limit: int) -> Select:
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    # One extra row tells us whether another page exists without a COUNT(*).
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+def finish_page(rows: Sequence, limit: int, response: Response) -> Sequence:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    if has_more:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    return rows
+
+def page_headers(response: Response) -> dict:
+    # The headers finish_page set, for handlers that return their own
+    # Response: FastAPI only merges them into responses it builds itself.
+    return {name: response.headers[name] for name in PAGINATION_HEADERS if name in response.headers}
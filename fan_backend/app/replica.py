@@ -0,0 +1,250 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from http.cookies import SimpleCookie
+from typing import Hashable, Optional
+
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+
+from .cache import TTLCache
+from .database import AsyncReadSessionLocal, AsyncSessionLocal, REPLICA_ENABLED, dialect_insert
+from .metrics import REGISTRY
+from .models import ReplicaHeartbeat, User
+
+logger = logging.getLogger(__name__)
+
+# Read routing between the primary and the read replica.
+#
+# A heartbeat row on the primary is bumped every REPLICA_HEARTBEAT_SECONDS,
+# and each worker reads back how far the replica has got. A request that
+# commits a write reads the heartbeat position inside its own transaction
+# (FOR SHARE on PostgreSQL; SQLite holds the write lock anyway), so the next
+# bump commits after it: once the replica reaches a higher position, it has
+# that write. The position goes back to the client as the X-Last-Write
+# header and a cookie; a client that sends either back reads from the
+# primary until the replica has caught up, whichever worker serves it. The
+# replica is skipped entirely while it lags more than REPLICA_MAX_LAG_SECONDS
+# or its position is unknown.
+REPLICA_HEARTBEAT_SECONDS = float(os.getenv("REPLICA_HEARTBEAT_SECONDS", "1"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# Markers are also remembered per user in-process, for clients that do not
+# echo them; this only bounds memory, the position decides.
+LAST_WRITE_TTL_SECONDS = float(os.getenv("LAST_WRITE_TTL_SECONDS", "300"))
+LAST_WRITE_MAX_USERS = int(os.getenv("LAST_WRITE_MAX_USERS", "100000"))
+LAST_WRITE_HEADER = "X-Last-Write"
+LAST_WRITE_COOKIE = "fan_last_write"
+
+HEARTBEAT_ID = 1
+
+READ_SESSIONS = REGISTRY.counter(
+    "fan_db_read_sessions_total",
+    "Read-only sessions handed out, by the database they were routed to",
+    ["target"],
+)
+REPLICA_LAG = REGISTRY.gauge(
+    "fan_db_replica_lag_seconds",
+    "Age of the newest heartbeat seen on the read replica",
+)
+
+class LastWrite:
+    __slots__ = ("position", "written")
+
+    def __init__(self, position: Optional[int] = None):
+        self.position = position
+        self.written = False
+
+    def advance(self, position: int):
+        self.position = position if self.position is None else max(self.position, position)
+        self.written = True
+
+# Per-request marker, shared with run_sync work like current_request_stats.
+current_last_write: ContextVar[Optional[LastWrite]] = ContextVar("current_last_write", default=None)
+
+# User ids and phones -> heartbeat position of their latest write.
+last_writes = TTLCache(maxsize=LAST_WRITE_MAX_USERS, ttl_seconds=LAST_WRITE_TTL_SECONDS)
+
+class ReplicaMonitor:
+    def __init__(self, max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS):
+        self.max_lag_seconds = max_lag_seconds
+        self.position: Optional[int] = None
+        self.beat_at: Optional[datetime] = None
+        self.checked_at = 0.0
+
+    @staticmethod
+    def beat(db: Session):
+        bumped = db.execute(
+            update(ReplicaHeartbeat)
+            .where(ReplicaHeartbeat.id == HEARTBEAT_ID)
+            .values(position=ReplicaHeartbeat.position + 1, beat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not bumped:
+            insert = dialect_insert(db)
+            db.execute(insert(ReplicaHeartbeat).values(
+                id=HEARTBEAT_ID, position=1, beat_at=datetime.utcnow()
+            ).on_conflict_do_nothing(index_elements=["id"]))
+        db.commit()
+
+    def check(self, db: Session):
+        try:
+            row = db.execute(
+                select(ReplicaHeartbeat.position, ReplicaHeartbeat.beat_at).where(ReplicaHeartbeat.id == HEARTBEAT_ID)
+            ).first()
+        except DBAPIError:
+            # A replica still being provisioned may not have the table yet.
+            if self.position is not None or not self.checked_at:
+                logger.warning("Read replica heartbeat unavailable; reading from the primary", exc_info=True)
+            row = None
+        self.position, self.beat_at = row if row is not None else (None, None)
+        self.checked_at = time.monotonic()
+
+    async def tick(self):
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(self.beat)
+        async with AsyncReadSessionLocal() as db:
+            await db.run_sync(self.check)
+
+    def lag(self) -> Optional[float]:
+        if self.beat_at is None:
+            return None
+        return max((datetime.utcnow() - self.beat_at).total_seconds(), 0.0)
+
+    def has_applied(self, position: Optional[int]) -> bool:
+        lag = self.lag()
+        if self.position is None or lag is None or lag > self.max_lag_seconds:
+            return False
+        if time.monotonic() - self.checked_at > self.max_lag_seconds:
+            return False
+        return position is None or self.position > position
+
+replica_monitor = ReplicaMonitor()
+REPLICA_LAG.set_function(lambda: replica_monitor.lag() or 0.0)
+
+@event.listens_for(Session, "after_flush")
+def _collect_writers(session, flush_context):
+    # Every row that belongs to a user (transactions, payments, outbox
+    # messages, the user itself) is remembered against that user. User rows
+    # also record the phone, which is all a token lookup knows.
+    if not REPLICA_ENABLED or current_last_write.get() is None:
+        return
+    session.info["wrote"] = True
+    writers = session.info.setdefault("writers", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            writers.update((obj.id, obj.phone))
+        elif getattr(obj, "user_id", None) is not None:
+            writers.add(obj.user_id)
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_bulk_writes(orm_execute_state):
+    if not REPLICA_ENABLED:
+        return
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+@event.listens_for(Session, "before_commit")
+def _read_write_position(session):
+    if not REPLICA_ENABLED or current_last_write.get() is None:
+        return
+    # Flush first so the position is read after our last write statement.
+    session.flush()
+    if not session.info.get("wrote"):
+        return
+    session.info["write_position"] = session.scalar(
+        select(ReplicaHeartbeat.position).where(ReplicaHeartbeat.id == HEARTBEAT_ID).with_for_update(read=True)
+    ) or 0
+
+@event.listens_for(Session, "after_commit")
+def _record_last_write(session):
+    session.info.pop("wrote", None)
+    writers = session.info.pop("writers", ())
+    position = session.info.pop("write_position", None)
+    last_write = current_last_write.get()
+    if position is None or last_write is None:
+        return
+    last_write.advance(position)
+    for writer in writers:
+        previous = last_writes.get(writer, count=False)
+        last_writes.set(writer, position if previous is None else max(previous, position))
+
+@event.listens_for(Session, "after_rollback")
+def _discard_last_write(session):
+    for key in ("wrote", "writers", "write_position"):
+        session.info.pop(key, None)
+
+def read_session(writer: Optional[Hashable] = None) -> AsyncSession:
+    # A read-only session on the replica, or on the primary until the
+    # replica has the caller's last write (from the request's marker, or
+    # remembered for `writer`, a user id or phone).
+    positions = []
+    last_write = current_last_write.get()
+    if last_write is not None and last_write.position is not None:
+        positions.append(last_write.position)
+    if writer is not None and REPLICA_ENABLED:
+        remembered = last_writes.get(writer, count=False)
+        if remembered is not None:
+            positions.append(remembered)
+    if REPLICA_ENABLED and replica_monitor.has_applied(max(positions, default=None)):
+        READ_SESSIONS.inc(target="replica")
+        return AsyncReadSessionLocal()
+    READ_SESSIONS.inc(target="primary")
+    return AsyncSessionLocal(info={"read_only": True})
+
+async def get_async_read_db():
+    # For routes with no per-user data; use auth.get_user_read_db otherwise.
+    async with read_session() as db:
+        yield db
+
+def _parse_position(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+def _client_position(scope) -> Optional[int]:
+    header = cookie = None
+    for name, value in scope.get("headers", ()):
+        if name == LAST_WRITE_HEADER.lower().encode():
+            header = _parse_position(value.decode("latin-1"))
+        elif name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(LAST_WRITE_COOKIE)
+            if morsel is not None:
+                cookie = _parse_position(morsel.value)
+    positions = [position for position in (header, cookie) if position is not None]
+    return max(positions, default=None)
+
+class LastWriteMiddleware:
+    # Pure ASGI, like RequestMetricsMiddleware: reads the client's marker
+    # and, when the request committed a write, sends the new one back.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        last_write = LastWrite(_client_position(scope))
+        token = current_last_write.set(last_write)
+
+        async def send_with_marker(message):
+            if message["type"] == "http.response.start" and last_write.written:
+                headers = MutableHeaders(scope=message)
+                headers.append(LAST_WRITE_HEADER, str(last_write.position))
+                headers.append(
+                    "Set-Cookie",
+                    f"{LAST_WRITE_COOKIE}={last_write.position}; Max-Age={int(LAST_WRITE_TTL_SECONDS)}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_marker)
+        finally:
+            current_last_write.reset(token)
@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+from typing import List
+
+from sqlalchemy import inspect, text
+
+from .database import create_tables, engine, migration_head
+from .models import Base
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(__file__)), "alembic.ini")
+
+# Deploy-time schema tools; nothing here runs at boot.
+#   python -m app.schema check   lists tables, columns and indexes the models
+#                                declare but the database lacks
+#   python -m app.schema adopt   brings a database built by create_all before
+#                                migrations existed up to the models (new
+#                                tables, nullable columns, indexes) and stamps
+#                                it at the migration head
+
+def missing_schema() -> List[str]:
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            missing.append(f"table {table.name}")
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing += [f"column {table.name}.{column.name}" for column in table.columns if column.name not in columns]
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing += [f"index {index.name}" for index in table.indexes if index.name not in indexes]
+    return missing
+
+def adopt() -> List[str]:
+    # Only nullable columns can be appended without a backfill; anything
+    # else is reported and needs a hand-written migration.
+    create_tables()
+    inspector = inspect(engine)
+    blocked = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable or column.primary_key:
+                    blocked.append(f"column {table.name}.{column.name}")
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    if not blocked:
+        from alembic import command
+        from alembic.config import Config
+
+        command.stamp(Config(ALEMBIC_INI), "head")
+    return blocked
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the database schema with the models")
+    parser.add_argument("command", choices=["check", "adopt"])
+    args = parser.parse_args()
+
+    if args.command == "adopt":
+        blocked = adopt()
+        if blocked:
+            sys.exit(f"Cannot add {', '.join(blocked)} without a migration; database not stamped")
+        print(f"Database adopted at revision {migration_head()}")
+        return
+    missing = missing_schema()
+    for entry in missing:
+        print(f"missing {entry}")
+    print(f"{len(missing)} difference(s)")
+    if missing:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
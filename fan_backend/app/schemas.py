@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from datetime import date, datetime
+from typing import Literal, Optional, List
 
 class UserBase(BaseModel):
     phone: str
@@ -98,16 +98,74 @@ class PartnerStation(BaseModel):
     contact_email: Optional[str]
     operating_hours: Optional[str]
     status: str
+    external_id: Optional[str] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
 
+class NearbyStation(PartnerStation):
+    distance_km: float
+
+class StationImportRow(PartnerStationCreate):
+    external_id: str = Field(min_length=1, max_length=64)
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    status: Literal["active", "inactive"] = "active"
+
+class StationImportError(BaseModel):
+    row: int
+    external_id: Optional[str] = None
+    errors: List[str]
+
+class StationImportResult(BaseModel):
+    created: int
+    updated: int
+    errors: List[StationImportError]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
     user: User
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class QRScanRequest(BaseModel):
     qr_code: str
     station_id: int
+
+class QRScanResponse(BaseModel):
+    message: str
+    transaction: Transaction
+
+class QRScanBatchRequest(BaseModel):
+    scans: List[QRScanRequest] = Field(..., min_length=1, max_length=500)
+
+class QRScanResult(BaseModel):
+    qr_code: str
+    station_id: int
+    result: Literal["redeemed", "already_used", "expired", "unknown", "retry"]
+    transaction: Optional[Transaction] = None
+
+class QRScanBatchResponse(BaseModel):
+    results: List[QRScanResult]
+
+class SettlementDay(BaseModel):
+    day: date
+    redeemed_count: int
+    redeemed_amount: float
+    
+    class Config:
+        from_attributes = True
+
+class StationSettlements(BaseModel):
+    station_id: int
+    date_from: date
+    date_to: date
+    redeemed_count: int
+    redeemed_amount: float
+    days: List[SettlementDay]
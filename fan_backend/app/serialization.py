@@ -0,0 +1,59 @@
+import json
+from datetime import datetime
+from typing import Mapping, Optional, Sequence
+
+import orjson
+from fastapi import Response
+from sqlalchemy import Select, select
+
+from .models import Payment, PartnerStation, Transaction
+from .schemas import Payment as PaymentSchema, PartnerStation as PartnerStationSchema, Transaction as TransactionSchema
+
+def _isoformat(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class RowEncoder:
+    # Fast path for list endpoints: the schema's columns are selected as plain
+    # tuples and encoded straight to JSON bytes with orjson, skipping ORM
+    # hydration, per-row pydantic models and FastAPI's json.dumps. The bytes
+    # match what response_model=List[schema] sends for the same rows.
+    def __init__(self, model, schema):
+        self.fields = tuple(schema.model_fields)
+        self.columns = tuple(getattr(model, name) for name in self.fields)
+        self.float_fields = tuple(
+            name for name, field in schema.model_fields.items() if field.annotation in (float, Optional[float])
+        )
+
+    def select(self) -> Select:
+        return select(*self.columns)
+
+    def encode(self, rows: Sequence) -> bytes:
+        records = []
+        orjson_safe = True
+        for row in rows:
+            record = dict(zip(self.fields, row))
+            for name in self.float_fields:
+                value = record[name]
+                if value is not None:
+                    # pydantic coerces ints in float fields ("1000" -> "1000.0").
+                    value = record[name] = float(value)
+                    # Python and orjson only differ on exponent notation
+                    # ("1e-05" vs "1e-5"), and orjson writes NaN as null.
+                    if not (value == 0 or 1e-4 <= abs(value) < 1e16):
+                        orjson_safe = False
+            records.append(record)
+        if orjson_safe:
+            return orjson.dumps(records)
+        # Same settings as FastAPI's JSONResponse.
+        return json.dumps(
+            records, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=_isoformat
+        ).encode("utf-8")
+
+    def response(self, rows: Sequence, headers: Optional[Mapping[str, str]] = None) -> Response:
+        return Response(content=self.encode(rows), media_type="application/json", headers=headers)
+
+transaction_rows = RowEncoder(Transaction, TransactionSchema)
+payment_rows = RowEncoder(Payment, PaymentSchema)
+station_rows = RowEncoder(PartnerStation, PartnerStationSchema)
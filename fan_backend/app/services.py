@@ -1,13 +1,43 @@
-import qrcode
 import io
+import os
 import base64
+import csv
+import hashlib
 import random
 import string
 from datetime import datetime, timedelta
 from typing import Optional
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .models import User, Transaction, Payment, PartnerStation, OTPVerification
+from .models import User, Transaction, Payment, PartnerStation
 from .auth import get_password_hash, verify_password
+from .cache import TTLCache
+from .catalogue import station_catalogue
+from .database import dialect_insert
+from .geo import station_index
+from .hashing import password_hasher
+from .ledger import CreditLedger
+from .otp import otp_store
+from .outbox import enqueue
+from .schemas import StationImportRow
+from .settlements import SettlementRollup
+from .velocity import velocity_tracker
+
+QR_IMAGE_CACHE_SIZE = int(os.getenv("QR_IMAGE_CACHE_SIZE", "2048"))
+QR_IMAGE_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Rendered QR images keyed by (qr_code, format). Entries live no longer than
+# the advance they encode and are evicted as soon as it is redeemed.
+qr_image_cache = TTLCache(maxsize=QR_IMAGE_CACHE_SIZE, ttl_seconds=24 * 60 * 60)
+
+STATION_IMPORT_FIELDS = (
+    "external_id", "name", "address", "latitude", "longitude",
+    "contact_phone", "contact_email", "operating_hours", "status"
+)
+STATION_IMPORT_MAX_ROWS = int(os.getenv("STATION_IMPORT_MAX_ROWS", "5000"))
+station_import_adapter = TypeAdapter(StationImportRow)
 
 class AuthService:
     @staticmethod
@@ -15,40 +45,50 @@ class AuthService:
         return ''.join(random.choices(string.digits, k=6))
     
     @staticmethod
-    def send_otp(phone: str, db: Session) -> bool:
+    def send_otp(phone: str, db: Session, purpose: str = "phone_verification") -> bool:
         otp_code = AuthService.generate_otp()
         expires_at = datetime.utcnow() + timedelta(minutes=5)
         
-        otp_verification = OTPVerification(
-            phone=phone,
-            otp_code=otp_code,
-            purpose="phone_verification",
-            expires_at=expires_at
-        )
-        db.add(otp_verification)
+        # The SMS goes out through the outbox, committed together with the
+        # code, so the request never waits on the provider.
+        enqueue(db, "otp", {"otp_code": otp_code}, recipient=phone)
+        otp_store.save(phone, otp_code, purpose, expires_at, db)
         db.commit()
-        
-        print(f"OTP for {phone}: {otp_code}")
         return True
     
     @staticmethod
-    def verify_otp(phone: str, otp_code: str, db: Session) -> bool:
-        otp_record = db.query(OTPVerification).filter(
-            OTPVerification.phone == phone,
-            OTPVerification.otp_code == otp_code,
-            OTPVerification.verified == False,
-            OTPVerification.expires_at > datetime.utcnow()
-        ).first()
-        
-        if otp_record:
-            otp_record.verified = True
-            db.commit()
-            return True
-        return False
+    async def send_otp_async(phone: str, db: AsyncSession, purpose: str = "phone_verification") -> bool:
+        return await db.run_sync(lambda session: AuthService.send_otp(phone, session, purpose))
+    
+    @staticmethod
+    def verify_otp(phone: str, otp_code: str, db: Session, purpose: str = "phone_verification") -> bool:
+        verified = otp_store.consume(phone, otp_code, purpose, db)
+        db.commit()
+        return verified
+    
+    @staticmethod
+    async def verify_otp_async(phone: str, otp_code: str, db: AsyncSession, purpose: str = "phone_verification") -> bool:
+        return await db.run_sync(lambda session: AuthService.verify_otp(phone, otp_code, session, purpose))
+    
+    @staticmethod
+    def get_user_by_phone(phone: str, db: Session) -> Optional[User]:
+        return db.query(User).filter(User.phone == phone).first()
+    
+    @staticmethod
+    async def get_user_by_phone_async(phone: str, db: AsyncSession) -> Optional[User]:
+        return await db.scalar(select(User).where(User.phone == phone))
     
     @staticmethod
     def create_user(phone: str, first_name: str, last_name: str, pin: str, db: Session) -> User:
-        pin_hash = get_password_hash(pin)
+        return AuthService.add_user(phone, first_name, last_name, get_password_hash(pin), db)
+    
+    @staticmethod
+    async def create_user_async(phone: str, first_name: str, last_name: str, pin: str, db: AsyncSession) -> User:
+        pin_hash = await password_hasher.hash(pin)
+        return await db.run_sync(lambda session: AuthService.add_user(phone, first_name, last_name, pin_hash, session))
+    
+    @staticmethod
+    def add_user(phone: str, first_name: str, last_name: str, pin_hash: str, db: Session) -> User:
         user = User(
             phone=phone,
             first_name=first_name,
@@ -56,36 +96,81 @@ class AuthService:
             pin_hash=pin_hash
         )
         db.add(user)
+        db.flush()
+        CreditLedger.open_account(user.id, db, balance=0.0)
         db.commit()
         db.refresh(user)
         return user
     
     @staticmethod
     def authenticate_user(phone: str, pin: str, db: Session) -> Optional[User]:
-        user = db.query(User).filter(User.phone == phone).first()
+        user = AuthService.get_user_by_phone(phone, db)
         if not user or not verify_password(pin, user.pin_hash):
             return None
         return user
+    
+    @staticmethod
+    async def authenticate_user_async(phone: str, pin: str, db: AsyncSession) -> Optional[User]:
+        user = await AuthService.get_user_by_phone_async(phone, db)
+        if not user or not await password_hasher.verify(pin, user.pin_hash):
+            return None
+        return user
 
 class TransactionService:
     @staticmethod
     def generate_qr_code(transaction_id: int, amount: float) -> str:
         qr_data = f"FAN:{transaction_id}:{amount}:{datetime.utcnow().isoformat()}"
+        img_str = base64.b64encode(TransactionService.render_qr_image(qr_data, "png")).decode()
+        return img_str
+    
+    @staticmethod
+    def render_qr_image(data: str, image_format: str = "png") -> bytes:
+        # qrcode pulls in PIL; imported on first render rather than at boot.
+        import qrcode
+        import qrcode.image.svg
+        
         qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
+        qr.add_data(data)
         qr.make(fit=True)
         
-        img = qr.make_image(fill_color="black", back_color="white")
         buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        return img_str
+        if image_format == "svg":
+            img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+            img.save(buffer)
+        else:
+            img = qr.make_image(fill_color="black", back_color="white")
+            img.save(buffer, format='PNG')
+        return buffer.getvalue()
+    
+    @staticmethod
+    def qr_image_etag(qr_code: str, image_format: str) -> str:
+        return '"' + hashlib.sha256(f"{qr_code}:{image_format}".encode()).hexdigest()[:32] + '"'
+    
+    @staticmethod
+    def get_qr_image(qr_code: str, image_format: str, expires_at: datetime) -> bytes:
+        key = (qr_code, image_format)
+        image = qr_image_cache.get(key)
+        if image is None:
+            image = TransactionService.render_qr_image(qr_code, image_format)
+            remaining = (expires_at - datetime.utcnow()).total_seconds()
+            if remaining > 0:
+                qr_image_cache.set(key, image, ttl_seconds=remaining)
+        return image
+    
+    @staticmethod
+    def evict_qr_images(*qr_codes: str):
+        for qr_code in qr_codes:
+            for image_format in QR_IMAGE_MEDIA_TYPES:
+                qr_image_cache.pop((qr_code, image_format))
     
     @staticmethod
     def create_advance_request(user_id: int, amount: float, station_id: Optional[int], db: Session) -> Transaction:
         qr_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
         expires_at = datetime.utcnow() + timedelta(hours=24)
         
+        velocity_tracker.check(user_id, amount, db)
+        CreditLedger.reserve(user_id, amount, db)
+        
         transaction = Transaction(
             user_id=user_id,
             station_id=station_id,
@@ -96,24 +181,157 @@ class TransactionService:
         db.add(transaction)
         db.commit()
         db.refresh(transaction)
+        velocity_tracker.record_advance(user_id, amount, transaction.created_at, db)
         return transaction
     
+    @staticmethod
+    async def create_advance_request_async(user_id: int, amount: float, station_id: Optional[int], db: AsyncSession) -> Transaction:
+        return await db.run_sync(
+            lambda session: TransactionService.create_advance_request(user_id, amount, station_id, session)
+        )
+    
     @staticmethod
     def validate_qr_scan(qr_code: str, station_id: int, db: Session) -> Optional[Transaction]:
-        transaction = db.query(Transaction).filter(
-            Transaction.qr_code == qr_code,
-            Transaction.status == "pending",
-            Transaction.expires_at > datetime.utcnow()
-        ).first()
+        # Single conditional UPDATE ... RETURNING: the status check and the
+        # redemption happen in one statement, so concurrent scans of the same
+        # code cannot both succeed.
+        now = datetime.utcnow()
+        stmt = (
+            update(Transaction)
+            .where(
+                Transaction.qr_code == qr_code,
+                Transaction.status == "pending",
+                Transaction.expires_at > now
+            )
+            .values(station_id=station_id, status="completed", completed_at=now)
+            .returning(Transaction)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        transaction = db.scalars(stmt).first()
+        if transaction is None:
+            TransactionService.expire_transactions(db, Transaction.qr_code == qr_code, now=now)
+        else:
+            SettlementRollup.record([(transaction.station_id, transaction.completed_at, transaction.amount)], db)
+            TransactionService.enqueue_redemption_receipts([transaction], db)
+        db.commit()
+        if transaction is not None:
+            TransactionService.evict_qr_images(qr_code)
+            velocity_tracker.record_redemptions([(transaction.user_id, station_id, transaction.completed_at)], db)
+        return transaction
+    
+    @staticmethod
+    def expire_transactions(db: Session, *criteria, now: Optional[datetime] = None) -> list:
+        # Moves due pending advances to "expired" and releases the credit they
+        # held, in the caller's transaction. Returns (id, user_id, amount,
+        # qr_code, expires_at) rows for what was expired.
+        now = now or datetime.utcnow()
+        expired = db.execute(
+            update(Transaction)
+            .where(Transaction.status == "pending", Transaction.expires_at <= now, *criteria)
+            .values(status="expired")
+            .returning(Transaction.id, Transaction.user_id, Transaction.amount, Transaction.qr_code, Transaction.expires_at)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if expired:
+            # Only the unpaid part of an advance is still held against credit.
+            paid = CreditLedger.paid_amounts([row.id for row in expired], db)
+            released: dict[int, float] = {}
+            for row in expired:
+                released[row.user_id] = released.get(row.user_id, 0.0) - (row.amount - paid.get(row.id, 0.0))
+            CreditLedger.adjust(released, db)
+            TransactionService.evict_qr_images(*(row.qr_code for row in expired))
+        return expired
+    
+    @staticmethod
+    def enqueue_redemption_receipts(transactions, db: Session):
+        for transaction in transactions:
+            enqueue(db, "redemption_receipt", {
+                "transaction_id": transaction.id,
+                "amount": transaction.amount,
+                "station_id": transaction.station_id,
+            }, user_id=transaction.user_id)
+    
+    @staticmethod
+    def redeem_qr_batch(scans: list[tuple[str, int]], db: Session) -> list[dict]:
+        # Redeems a terminal's queued scans in one transaction: a single
+        # UPDATE ... WHERE qr_code IN (...) RETURNING for every redeemable code,
+        # then one SELECT to classify the rest. A code repeated in the batch is
+        # redeemed by its first occurrence only; the repeats are already_used.
+        now = datetime.utcnow()
+        station_by_code: dict[str, int] = {}
+        for qr_code, station_id in scans:
+            station_by_code.setdefault(qr_code, station_id)
         
-        if transaction:
-            transaction.station_id = station_id
-            transaction.status = "completed"
-            transaction.completed_at = datetime.utcnow()
-            db.commit()
-            db.refresh(transaction)
+        stmt = (
+            update(Transaction)
+            .where(
+                Transaction.qr_code.in_(station_by_code),
+                Transaction.status == "pending",
+                Transaction.expires_at > now
+            )
+            .values(
+                station_id=case(station_by_code, value=Transaction.qr_code),
+                status="completed",
+                completed_at=now
+            )
+            .returning(Transaction)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        redeemed = {transaction.qr_code: transaction for transaction in db.scalars(stmt)}
+        SettlementRollup.record(
+            [(transaction.station_id, transaction.completed_at, transaction.amount) for transaction in redeemed.values()], db
+        )
+        TransactionService.enqueue_redemption_receipts(redeemed.values(), db)
         
-        return transaction
+        unresolved = [qr_code for qr_code in station_by_code if qr_code not in redeemed]
+        existing = {}
+        if unresolved:
+            TransactionService.expire_transactions(db, Transaction.qr_code.in_(unresolved), now=now)
+            existing = {
+                qr_code: (status, expires_at)
+                for qr_code, status, expires_at in db.execute(
+                    select(Transaction.qr_code, Transaction.status, Transaction.expires_at)
+                    .where(Transaction.qr_code.in_(unresolved))
+                )
+            }
+        db.commit()
+        TransactionService.evict_qr_images(*redeemed)
+        velocity_tracker.record_redemptions(
+            [(transaction.user_id, transaction.station_id, transaction.completed_at) for transaction in redeemed.values()], db
+        )
+        
+        results = []
+        claimed = set()
+        for qr_code, station_id in scans:
+            if qr_code in redeemed and qr_code not in claimed:
+                claimed.add(qr_code)
+                results.append({"qr_code": qr_code, "station_id": station_id, "result": "redeemed", "transaction": redeemed[qr_code]})
+                continue
+            if qr_code in redeemed:
+                result = "already_used"
+            elif qr_code not in existing:
+                result = "unknown"
+            else:
+                # Classified from the state read after the UPDATE. A code that
+                # is still pending and unexpired was held by a concurrent
+                # transaction that did not redeem it; the terminal can resend it.
+                status, expires_at = existing[qr_code]
+                if status == "completed":
+                    result = "already_used"
+                elif status == "expired" or expires_at <= now:
+                    result = "expired"
+                else:
+                    result = "retry"
+            results.append({"qr_code": qr_code, "station_id": station_id, "result": result, "transaction": None})
+        return results
+    
+    @staticmethod
+    async def redeem_qr_batch_async(scans: list[tuple[str, int]], db: AsyncSession) -> list[dict]:
+        return await db.run_sync(lambda session: TransactionService.redeem_qr_batch(scans, session))
+    
+    @staticmethod
+    async def validate_qr_scan_async(qr_code: str, station_id: int, db: AsyncSession) -> Optional[Transaction]:
+        return await db.run_sync(lambda session: TransactionService.validate_qr_scan(qr_code, station_id, session))
 
 class PaymentService:
     @staticmethod
@@ -123,6 +341,7 @@ class PaymentService:
     @staticmethod
     def process_payment(transaction_id: int, user_id: int, amount: float, method: str, db: Session) -> Payment:
         reference = PaymentService.generate_payment_reference()
+        CreditLedger.settle(user_id, transaction_id, amount, db)
         
         payment = Payment(
             transaction_id=transaction_id,
@@ -134,15 +353,58 @@ class PaymentService:
             processed_at=datetime.utcnow()
         )
         db.add(payment)
+        enqueue(db, "payment_receipt", {
+            "transaction_id": transaction_id,
+            "amount": amount,
+            "reference": reference,
+        }, user_id=user_id)
         db.commit()
         db.refresh(payment)
         return payment
+    
+    @staticmethod
+    async def process_payment_async(transaction_id: int, user_id: int, amount: float, method: str, db: AsyncSession) -> Payment:
+        return await db.run_sync(
+            lambda session: PaymentService.process_payment(transaction_id, user_id, amount, method, session)
+        )
 
 class StationService:
     @staticmethod
-    def find_nearby_stations(latitude: float, longitude: float, radius_km: float, db: Session) -> list[PartnerStation]:
-        stations = db.query(PartnerStation).filter(PartnerStation.status == "active").all()
-        return stations[:10]
+    def load_station_index(db: Session):
+        points = db.query(PartnerStation.id, PartnerStation.latitude, PartnerStation.longitude).filter(
+            PartnerStation.status == "active"
+        ).all()
+        station_index.rebuild(points)
+    
+    @staticmethod
+    def find_nearby_stations(latitude: float, longitude: float, radius_km: Optional[float], db: Session, limit: int = 10) -> list[PartnerStation]:
+        if station_index.is_stale():
+            StationService.load_station_index(db)
+        
+        matches = station_index.nearest(latitude, longitude, radius_km=radius_km, limit=limit)
+        if not matches:
+            return []
+        
+        stations = {
+            station.id: station
+            for station in db.query(PartnerStation).filter(
+                PartnerStation.id.in_([station_id for station_id, _ in matches]),
+                PartnerStation.status == "active"
+            )
+        }
+        nearby = []
+        for station_id, distance in matches:
+            station = stations.get(station_id)
+            if station is not None:
+                station.distance_km = round(distance, 3)
+                nearby.append(station)
+        return nearby
+    
+    @staticmethod
+    async def find_nearby_stations_async(latitude: float, longitude: float, radius_km: Optional[float], db: AsyncSession, limit: int = 10) -> list[PartnerStation]:
+        return await db.run_sync(
+            lambda session: StationService.find_nearby_stations(latitude, longitude, radius_km, session, limit=limit)
+        )
     
     @staticmethod
     def create_station(name: str, address: str, latitude: float, longitude: float, db: Session, **kwargs) -> PartnerStation:
@@ -156,4 +418,109 @@ class StationService:
         db.add(station)
         db.commit()
         db.refresh(station)
+        if station.status == "active":
+            station_index.upsert(station.id, station.latitude, station.longitude)
         return station
+    
+    @staticmethod
+    async def create_station_async(name: str, address: str, latitude: float, longitude: float, db: AsyncSession, **kwargs) -> PartnerStation:
+        return await db.run_sync(
+            lambda session: StationService.create_station(name, address, latitude, longitude, session, **kwargs)
+        )
+    
+    @staticmethod
+    def parse_station_csv(content: str) -> list[dict]:
+        # Blank cells become missing fields so optional columns can be left empty.
+        return [
+            {key.strip(): value.strip() for key, value in record.items() if key is not None and value and value.strip()}
+            for record in csv.DictReader(io.StringIO(content))
+        ]
+    
+    @staticmethod
+    def validate_station_rows(records: list) -> tuple[list[dict], list[dict]]:
+        # One pass over the upload: returns the valid rows and a per-row error
+        # list (rows are numbered from 1). A repeated external_id keeps its
+        # first occurrence.
+        valid = []
+        errors = []
+        seen: dict[str, int] = {}
+        for position, record in enumerate(records, start=1):
+            external_id = record.get("external_id") if isinstance(record, dict) else None
+            external_id = None if external_id is None else str(external_id)
+            try:
+                row = station_import_adapter.validate_python(record)
+            except ValidationError as exc:
+                errors.append({
+                    "row": position,
+                    "external_id": external_id,
+                    "errors": [
+                        f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+                        for error in exc.errors()
+                    ]
+                })
+                continue
+            if row.external_id in seen:
+                errors.append({
+                    "row": position,
+                    "external_id": external_id,
+                    "errors": [f"external_id: duplicate of row {seen[row.external_id]}"]
+                })
+                continue
+            seen[row.external_id] = position
+            # Without a status column, existing stations keep their status.
+            valid.append(row.model_dump(exclude=None if "status" in row.model_fields_set else {"status"}))
+        return valid, errors
+    
+    @staticmethod
+    def bulk_upsert_stations(rows: list[dict], db: Session) -> tuple[int, int]:
+        # One INSERT ... ON CONFLICT (external_id) DO UPDATE for the whole
+        # batch, then a single refresh of the spatial index and the station
+        # catalogue. Returns (created, updated).
+        if not rows:
+            return 0, 0
+        
+        table = PartnerStation.__table__
+        existing = set(db.scalars(
+            select(PartnerStation.external_id).where(PartnerStation.external_id.in_([row["external_id"] for row in rows]))
+        ))
+        now = datetime.utcnow()
+        written = []
+        # Rows that leave out status only set it on insert, so an upload
+        # without the column does not reactivate stations.
+        for with_status in (True, False):
+            batch = [row for row in rows if ("status" in row) == with_status]
+            if not batch:
+                continue
+            stmt = dialect_insert(db)(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.external_id],
+                set_={
+                    **{
+                        name: stmt.excluded[name] for name in STATION_IMPORT_FIELDS
+                        if name != "external_id" and (with_status or name != "status")
+                    },
+                    "updated_at": now
+                }
+            ).returning(table.c.id, table.c.latitude, table.c.longitude, table.c.status)
+            written += db.execute(stmt, [
+                {
+                    **{name: row.get(name) for name in STATION_IMPORT_FIELDS},
+                    "status": row.get("status", "active"),
+                    "created_at": now,
+                    "updated_at": now
+                }
+                for row in batch
+            ]).all()
+        db.commit()
+        
+        for station_id, latitude, longitude, station_status in written:
+            if station_status == "active":
+                station_index.upsert(station_id, latitude, longitude)
+            else:
+                station_index.remove(station_id)
+        station_catalogue.invalidate()
+        return len(rows) - len(existing), len(existing)
+    
+    @staticmethod
+    async def bulk_upsert_stations_async(rows: list[dict], db: AsyncSession) -> tuple[int, int]:
+        return await db.run_sync(lambda session: StationService.bulk_upsert_stations(rows, session))
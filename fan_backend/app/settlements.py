@@ -0,0 +1,126 @@
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .database import dialect_insert
+from .models import StationDailyRollup, Transaction
+
+REBUILD_CHUNK_DAYS = 7
+REBUILD_BATCH_SIZE = 5000
+SETTLEMENT_MAX_DAYS = 366
+
+class SettlementRollup:
+    # station_daily_rollup holds the redeemed count and amount per station
+    # and UTC day. Redemptions add to it in the same transaction that
+    # completes the advance, so a settlement report reads one row per day
+    # instead of aggregating every transaction. Callers commit.
+    @staticmethod
+    def _aggregate(redemptions: Iterable[Tuple[Optional[int], Optional[datetime], float]]) -> Dict[Tuple[int, date], List]:
+        totals: Dict[Tuple[int, date], List] = defaultdict(lambda: [0, 0.0])
+        for station_id, completed_at, amount in redemptions:
+            if station_id is None or completed_at is None:
+                continue
+            entry = totals[(station_id, completed_at.date())]
+            entry[0] += 1
+            entry[1] += amount
+        return totals
+
+    @staticmethod
+    def _add(totals: Dict[Tuple[int, date], List], db: Session):
+        if not totals:
+            return
+        table = StationDailyRollup.__table__
+        now = datetime.utcnow()
+        stmt = dialect_insert(db)(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.station_id, table.c.day],
+            set_={
+                "redeemed_count": table.c.redeemed_count + stmt.excluded.redeemed_count,
+                "redeemed_amount": table.c.redeemed_amount + stmt.excluded.redeemed_amount,
+                "updated_at": now
+            }
+        )
+        db.execute(stmt, [
+            {"station_id": station_id, "day": day, "redeemed_count": count, "redeemed_amount": amount, "updated_at": now}
+            for (station_id, day), (count, amount) in totals.items()
+        ])
+
+    @staticmethod
+    def record(redemptions: Iterable[Tuple[Optional[int], Optional[datetime], float]], db: Session):
+        # redemptions: (station_id, completed_at, amount) per completed advance.
+        SettlementRollup._add(SettlementRollup._aggregate(redemptions), db)
+
+    @staticmethod
+    def daily(station_id: int, date_from: date, date_to: date, db: Session) -> list:
+        return db.scalars(
+            select(StationDailyRollup)
+            .where(
+                StationDailyRollup.station_id == station_id,
+                StationDailyRollup.day >= date_from,
+                StationDailyRollup.day <= date_to
+            )
+            .order_by(StationDailyRollup.day)
+        ).all()
+
+    @staticmethod
+    def rebuild(
+        db: Session,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        chunk_days: int = REBUILD_CHUNK_DAYS
+    ) -> int:
+        # Recomputes [date_from, date_to] (inclusive) from completed
+        # transactions, one window of chunk_days per commit. Each window's
+        # rollup rows are replaced, so reruns are safe. Returns rows written.
+        if date_from is None:
+            first = db.scalar(select(func.min(Transaction.completed_at)).where(Transaction.status == "completed"))
+            if first is None:
+                return 0
+            date_from = first.date()
+        date_to = date_to or datetime.utcnow().date()
+
+        written = 0
+        window_start = date_from
+        while window_start <= date_to:
+            window_end = min(window_start + timedelta(days=chunk_days), date_to + timedelta(days=1))
+            db.execute(delete(StationDailyRollup).where(
+                StationDailyRollup.day >= window_start,
+                StationDailyRollup.day < window_end
+            ))
+            rows = db.execute(
+                select(Transaction.station_id, Transaction.completed_at, Transaction.amount)
+                .where(
+                    Transaction.status == "completed",
+                    Transaction.completed_at >= datetime.combine(window_start, datetime.min.time()),
+                    Transaction.completed_at < datetime.combine(window_end, datetime.min.time())
+                )
+                .execution_options(yield_per=REBUILD_BATCH_SIZE)
+            )
+            totals = SettlementRollup._aggregate(rows)
+            SettlementRollup._add(totals, db)
+            db.commit()
+            written += len(totals)
+            window_start = window_end
+        return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild station_daily_rollup from completed transactions")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="first day (default: earliest redemption)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="last day, inclusive (default: today)")
+    parser.add_argument("--chunk-days", type=int, default=REBUILD_CHUNK_DAYS)
+    args = parser.parse_args()
+
+    from .database import SessionLocal, prepare_schema
+
+    prepare_schema()
+    with SessionLocal() as db:
+        written = SettlementRollup.rebuild(db, args.date_from, args.date_to, chunk_days=args.chunk_days)
+    print(f"{written} station-day row(s) written")
+
+if __name__ == "__main__":
+    main()
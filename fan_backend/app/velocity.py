@@ -0,0 +1,432 @@
+import argparse
+import csv
+import math
+import os
+import sys
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .metrics import REGISTRY
+from .models import Transaction
+
+VELOCITY_CHECKS = os.getenv("VELOCITY_CHECKS", "true").lower() in ("1", "true", "yes")
+VELOCITY_MAX_PER_HOUR = int(os.getenv("VELOCITY_MAX_PER_HOUR", "5"))
+VELOCITY_MAX_PER_DAY = int(os.getenv("VELOCITY_MAX_PER_DAY", "20"))
+VELOCITY_MAX_STATIONS_PER_DAY = int(os.getenv("VELOCITY_MAX_STATIONS_PER_DAY", "6"))
+VELOCITY_MAX_AMOUNT_ZSCORE = float(os.getenv("VELOCITY_MAX_AMOUNT_ZSCORE", "4"))
+# The z-score is only meaningful once a user has some history.
+VELOCITY_MIN_HISTORY = int(os.getenv("VELOCITY_MIN_HISTORY", "5"))
+VELOCITY_HISTORY_DAYS = int(os.getenv("VELOCITY_HISTORY_DAYS", "90"))
+# How often a user's amount statistics are reloaded, so advances older than
+# VELOCITY_HISTORY_DAYS drop out of them.
+VELOCITY_STATS_REFRESH_HOURS = float(os.getenv("VELOCITY_STATS_REFRESH_HOURS", "24"))
+# How often windows with no event inside the history window are dropped.
+VELOCITY_EVICT_INTERVAL_SECONDS = float(os.getenv("VELOCITY_EVICT_INTERVAL_SECONDS", "3600"))
+# Ring-buffer capacity per user; must stay above VELOCITY_MAX_PER_DAY.
+VELOCITY_WINDOW_EVENTS = 64
+RESCORE_BATCH_SIZE = 100_000
+
+HOUR_SECONDS = 3600.0
+DAY_SECONDS = 86400.0
+EPOCH = datetime(1970, 1, 1)
+
+VELOCITY_REJECTIONS = REGISTRY.counter(
+    "fan_velocity_rejections_total",
+    "Advance requests declined by velocity checks",
+    ["reason"],
+)
+VELOCITY_TRACKED_USERS = REGISTRY.gauge(
+    "fan_velocity_tracked_users",
+    "Users with an in-memory velocity window",
+)
+
+def _seconds(value: datetime) -> float:
+    return (value - EPOCH).total_seconds()
+
+class VelocityLimitExceeded(Exception):
+    def __init__(self, reasons: List[str]):
+        super().__init__(", ".join(reasons))
+        self.reasons = reasons
+
+class VelocityScore(NamedTuple):
+    advances_last_hour: int
+    advances_last_day: int
+    stations_last_day: int
+    amount_zscore: Optional[float]
+
+    def reasons(self) -> List[str]:
+        reasons = []
+        if self.advances_last_hour >= VELOCITY_MAX_PER_HOUR:
+            reasons.append("hourly_advances")
+        if self.advances_last_day >= VELOCITY_MAX_PER_DAY:
+            reasons.append("daily_advances")
+        if self.stations_last_day >= VELOCITY_MAX_STATIONS_PER_DAY:
+            reasons.append("daily_stations")
+        if self.amount_zscore is not None and self.amount_zscore > VELOCITY_MAX_AMOUNT_ZSCORE:
+            reasons.append("amount_zscore")
+        return reasons
+
+class UserWindow:
+    # Advances (created_at) and redemptions (completed_at, station) from the
+    # last 24 hours in bounded ring buffers, plus running count/mean/M2
+    # (Welford) of advance amounts over the history window. `stats_at` is
+    # when count/mean/M2 were last loaded from the history window; new
+    # advances are folded in until the next reload. `last_event_at` is the
+    # newest advance or redemption the window has seen.
+    __slots__ = ("advances", "redemptions", "count", "mean", "m2", "stats_at", "last_event_at")
+
+    def __init__(self, stats_at: Optional[float] = None):
+        self.advances: Deque[float] = deque(maxlen=VELOCITY_WINDOW_EVENTS)
+        self.redemptions: Deque[Tuple[float, int]] = deque(maxlen=VELOCITY_WINDOW_EVENTS)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.stats_at = _seconds(datetime.utcnow()) if stats_at is None else stats_at
+        self.last_event_at = 0.0
+
+    def set_stats(self, count: int, mean: float, mean_square: float, stats_at: float):
+        self.count = count
+        self.mean = mean if count else 0.0
+        self.m2 = max(0.0, (mean_square - mean * mean) * count) if count else 0.0
+        self.stats_at = stats_at
+
+    def add_advance(self, at: float, amount: float):
+        self.advances.append(at)
+        self.last_event_at = max(self.last_event_at, at)
+        self.count += 1
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+
+    def add_redemption(self, at: float, station_id: int):
+        self.redemptions.append((at, station_id))
+        self.last_event_at = max(self.last_event_at, at)
+
+    def score(self, amount: float, now: float) -> VelocityScore:
+        day_start = now - DAY_SECONDS
+        while self.advances and self.advances[0] <= day_start:
+            self.advances.popleft()
+        while self.redemptions and self.redemptions[0][0] <= day_start:
+            self.redemptions.popleft()
+        hour_start = now - HOUR_SECONDS
+        last_hour = 0
+        for at in reversed(self.advances):
+            if at <= hour_start:
+                break
+            last_hour += 1
+        zscore = None
+        if self.count >= VELOCITY_MIN_HISTORY:
+            std = math.sqrt(self.m2 / (self.count - 1))
+            if std > 0:
+                zscore = (amount - self.mean) / std
+        return VelocityScore(last_hour, len(self.advances), len({station for _, station in self.redemptions}), zscore)
+
+class VelocityTracker:
+    # Per-user sliding windows held in process memory, so scoring an advance
+    # is a dict lookup and a scan of at most VELOCITY_WINDOW_EVENTS floats
+    # instead of aggregate queries on transactions. hydrate() bulk-loads
+    # every window once after boot; until it finishes, a user's window is
+    # loaded on first use. Amount statistics are reloaded per user every
+    # VELOCITY_STATS_REFRESH_HOURS so old advances age out, and evict_idle()
+    # drops users with nothing inside the history window: their window would
+    # score exactly like the empty one created on their next advance.
+    #
+    # Windows are per process: each worker sees the hydrated history plus
+    # its own traffic since boot, so with N workers a user can get up to N
+    # times the hourly and daily limits before any one worker rejects them.
+    def __init__(self):
+        self._users: Dict[int, UserWindow] = {}
+        self._lock = threading.Lock()
+        self.hydrated = False
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    @staticmethod
+    def _load_history(db: Session, now: datetime, *criteria):
+        # (user_id, count, mean, mean of squares, newest created_at) of
+        # advances in the history window.
+        return db.execute(
+            select(
+                Transaction.user_id,
+                func.count(),
+                func.avg(Transaction.amount),
+                func.avg(Transaction.amount * Transaction.amount),
+                func.max(Transaction.created_at),
+            )
+            .where(Transaction.created_at >= now - timedelta(days=VELOCITY_HISTORY_DAYS), *criteria)
+            .group_by(Transaction.user_id)
+        )
+
+    @staticmethod
+    def _load(db: Session, *criteria) -> Dict[int, UserWindow]:
+        now = datetime.utcnow()
+        day_start = now - timedelta(days=1)
+        windows: Dict[int, UserWindow] = {}
+        for user_id, count, mean, mean_square, last_created_at in VelocityTracker._load_history(db, now, *criteria):
+            window = windows[user_id] = UserWindow(_seconds(now))
+            window.set_stats(count, mean, mean_square, _seconds(now))
+            window.last_event_at = _seconds(last_created_at)
+        advances = db.execute(
+            select(Transaction.user_id, Transaction.created_at)
+            .where(Transaction.created_at > day_start, *criteria)
+            .order_by(Transaction.created_at)
+        )
+        for user_id, created_at in advances:
+            windows.setdefault(user_id, UserWindow()).advances.append(_seconds(created_at))
+        redemptions = db.execute(
+            select(Transaction.user_id, Transaction.completed_at, Transaction.station_id)
+            .where(Transaction.completed_at > day_start, Transaction.station_id.is_not(None), *criteria)
+            .order_by(Transaction.completed_at)
+        )
+        for user_id, completed_at, station_id in redemptions:
+            windows.setdefault(user_id, UserWindow()).add_redemption(_seconds(completed_at), station_id)
+        return windows
+
+    def hydrate(self, db: Session) -> int:
+        windows = self._load(db)
+        with self._lock:
+            # Users loaded individually while this ran have seen every event
+            # since; their windows win over the bulk snapshot.
+            windows.update(self._users)
+            self._users = windows
+            self.hydrated = True
+        return len(windows)
+
+    def _window(self, user_id: int, db: Session) -> UserWindow:
+        window = self._users.get(user_id)
+        if window is not None:
+            return window
+        if self.hydrated:
+            loaded = UserWindow()
+        else:
+            loaded = self._load(db, Transaction.user_id == user_id).get(user_id) or UserWindow()
+        with self._lock:
+            return self._users.setdefault(user_id, loaded)
+
+    def _refresh_stats(self, user_id: int, window: UserWindow, db: Session):
+        now = datetime.utcnow()
+        if _seconds(now) - window.stats_at < VELOCITY_STATS_REFRESH_HOURS * HOUR_SECONDS:
+            return
+        row = self._load_history(db, now, Transaction.user_id == user_id).first()
+        with self._lock:
+            window.set_stats(*(row[1:4] if row is not None else (0, 0.0, 0.0)), _seconds(now))
+
+    def score(self, user_id: int, amount: float, db: Session, now: Optional[datetime] = None) -> VelocityScore:
+        window = self._window(user_id, db)
+        self._refresh_stats(user_id, window, db)
+        with self._lock:
+            return window.score(amount, _seconds(now or datetime.utcnow()))
+
+    def check(self, user_id: int, amount: float, db: Session) -> Optional[VelocityScore]:
+        if not VELOCITY_CHECKS:
+            return None
+        score = self.score(user_id, amount, db)
+        reasons = score.reasons()
+        if reasons:
+            for reason in reasons:
+                VELOCITY_REJECTIONS.inc(reason=reason)
+            raise VelocityLimitExceeded(reasons)
+        return score
+
+    def evict_idle(self, now: Optional[datetime] = None) -> int:
+        cutoff = _seconds(now or datetime.utcnow()) - VELOCITY_HISTORY_DAYS * DAY_SECONDS
+        with self._lock:
+            idle = [user_id for user_id, window in self._users.items() if window.last_event_at < cutoff]
+            for user_id in idle:
+                del self._users[user_id]
+        return len(idle)
+
+    def _recording_window(self, user_id: int, db: Session) -> Optional[UserWindow]:
+        # Called after commit. A window loaded from the database now already
+        # contains the event being recorded, so None tells the caller to skip.
+        with self._lock:
+            window = self._users.get(user_id)
+            if window is None and self.hydrated:
+                window = self._users[user_id] = UserWindow()
+        if window is None:
+            self._window(user_id, db)
+        return window
+
+    def record_advance(self, user_id: int, amount: float, created_at: datetime, db: Session):
+        if not VELOCITY_CHECKS:
+            return
+        window = self._recording_window(user_id, db)
+        if window is not None:
+            with self._lock:
+                window.add_advance(_seconds(created_at), amount)
+                # Put it back if evict_idle dropped it since we looked it up.
+                self._users.setdefault(user_id, window)
+
+    def record_redemptions(self, redemptions: List[Tuple[int, int, datetime]], db: Session):
+        # (user_id, station_id, completed_at) per redeemed advance.
+        if not VELOCITY_CHECKS:
+            return
+        for user_id, station_id, completed_at in redemptions:
+            window = self._recording_window(user_id, db)
+            if window is not None:
+                with self._lock:
+                    window.add_redemption(_seconds(completed_at), station_id)
+                    self._users.setdefault(user_id, window)
+
+velocity_tracker = VelocityTracker()
+VELOCITY_TRACKED_USERS.set_function(lambda: len(velocity_tracker))
+
+def _load_columns(db: Session, stmt, batch_size: int) -> list:
+    import numpy as np
+
+    chunks = [[] for _ in stmt.selected_columns]
+    for partition in db.execute(stmt.execution_options(yield_per=batch_size)).partitions():
+        for index, column in enumerate(zip(*partition)):
+            chunks[index].append(np.asarray(column))
+    return [np.concatenate(chunk) if chunk else np.empty(0) for chunk in chunks]
+
+def _epoch_seconds(values):
+    import numpy as np
+
+    return values.astype("datetime64[us]").astype(np.int64) / 1e6
+
+def rescore(db: Session, since: Optional[datetime] = None, batch_size: int = RESCORE_BATCH_SIZE) -> dict:
+    # Offline re-scoring of every advance in the book with the same rules as
+    # VelocityTracker, vectorized with NumPy: advances are sorted by (user,
+    # created_at) and laid out on one axis with each user's timeline shifted
+    # by a per-user stride, so every window count is a pair of searchsorted
+    # calls over the whole book. Returns the features and reasons per advance.
+    import numpy as np
+
+    criteria = [Transaction.created_at >= since] if since is not None else []
+    ids, user_ids, created_at, amounts = _load_columns(db, (
+        select(Transaction.id, Transaction.user_id, Transaction.created_at, Transaction.amount).where(*criteria)
+    ), batch_size)
+    if not len(ids):
+        return {"ids": ids, "flagged": np.zeros(0, dtype=bool)}
+    redeemed_users, completed_at, station_ids = _load_columns(db, (
+        select(Transaction.user_id, Transaction.completed_at, Transaction.station_id)
+        .where(Transaction.completed_at.is_not(None), Transaction.station_id.is_not(None), *criteria)
+    ), batch_size)
+
+    created = _epoch_seconds(created_at)
+    amounts = amounts.astype(np.float64)
+    order = np.lexsort((created, user_ids))
+    ids, user_ids, created, amounts = ids[order], user_ids[order], created[order], amounts[order]
+    users, ranks = np.unique(user_ids, return_inverse=True)
+
+    completed = _epoch_seconds(completed_at) if len(completed_at) else np.empty(0)
+    origin = min(created.min(), completed.min()) if len(completed) else created.min()
+    latest = max(created.max(), completed.max()) if len(completed) else created.max()
+    history_seconds = VELOCITY_HISTORY_DAYS * DAY_SECONDS
+    stride = (latest - origin) + max(2 * DAY_SECONDS, history_seconds + DAY_SECONDS)
+    keys = ranks * stride + (created - origin)
+
+    # Advances recorded before this one and inside (t - window, t], as
+    # VelocityTracker counts them; ties keep the book order.
+    before = np.arange(len(keys))
+    last_hour = before - np.searchsorted(keys, keys - HOUR_SECONDS, "right")
+    last_day = before - np.searchsorted(keys, keys - DAY_SECONDS, "right")
+
+    # Distinct stations redeemed in (t - 1 day, t]: every redemption covers
+    # [completed_at, completed_at + 1 day); overlapping cover of the same
+    # (user, station) is merged, and the stations at t are the merged
+    # intervals that started at or before t minus those that ended by then.
+    stations_last_day = np.zeros(len(keys), dtype=np.int64)
+    if len(completed):
+        redeemed_ranks = np.searchsorted(users, redeemed_users)
+        order = np.lexsort((completed, station_ids, redeemed_ranks))
+        redeemed_ranks, station_ids, completed = redeemed_ranks[order], station_ids[order], completed[order]
+        new_run = np.ones(len(completed), dtype=bool)
+        new_run[1:] = (
+            (redeemed_ranks[1:] != redeemed_ranks[:-1])
+            | (station_ids[1:] != station_ids[:-1])
+            | (completed[1:] - completed[:-1] >= DAY_SECONDS)
+        )
+        run_end = np.ones(len(completed), dtype=bool)
+        run_end[:-1] = new_run[1:]
+        offsets = redeemed_ranks * stride - origin
+        starts = np.sort((offsets + completed)[new_run])
+        ends = np.sort((offsets + completed + DAY_SECONDS)[run_end])
+        stations_last_day = np.searchsorted(starts, keys, "right") - np.searchsorted(ends, keys, "right")
+
+    # Sample mean and deviation of each user's earlier amounts inside the
+    # history window, [t - VELOCITY_HISTORY_DAYS, t).
+    first = np.maximum(np.searchsorted(ranks, ranks, "left"), np.searchsorted(keys, keys - history_seconds, "left"))
+    prior_count = before - first
+    sums = np.cumsum(amounts) - amounts
+    squares = np.cumsum(amounts * amounts) - amounts * amounts
+    prior_sum = sums - sums[first]
+    prior_squares = squares - squares[first]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = prior_sum / prior_count
+        variance = (prior_squares - prior_count * mean * mean) / (prior_count - 1)
+        zscore = (amounts - mean) / np.sqrt(variance)
+    zscore = np.where((prior_count >= VELOCITY_MIN_HISTORY) & (variance > 0), zscore, np.nan)
+
+    reasons = {
+        "hourly_advances": last_hour >= VELOCITY_MAX_PER_HOUR,
+        "daily_advances": last_day >= VELOCITY_MAX_PER_DAY,
+        "daily_stations": stations_last_day >= VELOCITY_MAX_STATIONS_PER_DAY,
+        "amount_zscore": np.nan_to_num(zscore, nan=-np.inf) > VELOCITY_MAX_AMOUNT_ZSCORE,
+    }
+    return {
+        "ids": ids,
+        "user_ids": user_ids,
+        "created_at": created,
+        "amounts": amounts,
+        "advances_last_hour": last_hour,
+        "advances_last_day": last_day,
+        "stations_last_day": stations_last_day,
+        "amount_zscore": zscore,
+        "reasons": reasons,
+        "flagged": np.logical_or.reduce(list(reasons.values())),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score the advance book with the velocity rules (needs numpy)")
+    parser.add_argument("command", choices=["rescore"])
+    parser.add_argument("--days", type=int, help="only advances created in the last N days (default: all)")
+    parser.add_argument("--output", help="write flagged advances to this CSV file")
+    parser.add_argument("--batch-size", type=int, default=RESCORE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        sys.exit("numpy is required for rescoring: poetry install --with analytics")
+
+    from .database import SessionLocal
+
+    since = datetime.utcnow() - timedelta(days=args.days) if args.days else None
+    with SessionLocal() as db:
+        scored = rescore(db, since, batch_size=args.batch_size)
+    flagged = scored["flagged"]
+    print(f"{len(scored['ids'])} advance(s) scored, {int(flagged.sum())} flagged")
+    for reason, mask in scored.get("reasons", {}).items():
+        print(f"  {reason}: {int(mask.sum())}")
+    if args.output and len(scored["ids"]):
+        reasons = scored["reasons"]
+        with open(args.output, "w", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow([
+                "transaction_id", "user_id", "created_at", "amount",
+                "advances_last_hour", "advances_last_day", "stations_last_day", "amount_zscore", "reasons",
+            ])
+            for index in flagged.nonzero()[0]:
+                zscore = scored["amount_zscore"][index]
+                writer.writerow([
+                    int(scored["ids"][index]),
+                    int(scored["user_ids"][index]),
+                    datetime.utcfromtimestamp(scored["created_at"][index]).isoformat(),
+                    float(scored["amounts"][index]),
+                    int(scored["advances_last_hour"][index]),
+                    int(scored["advances_last_day"][index]),
+                    int(scored["stations_last_day"][index]),
+                    "" if math.isnan(zscore) else round(float(zscore), 3),
+                    ";".join(reason for reason, mask in reasons.items() if mask[index]),
+                ])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Shared helpers for the benchmark suite: an isolated, seeded SQLite
+# database and a stable JSON report format that can be diffed across
+# commits with `python -m benchmarks.compare old.json new.json`.
+
+BENCH_PIN = "1234"
+ADMIN_PHONE = "08099999999"
+
+def use_scratch_database(prefix: str = "fan-bench-") -> str:
+    # Must run before anything under app/ is imported: the engines are
+    # created from DATABASE_URL at import time.
+    if "DATABASE_URL" not in os.environ:
+        scratch = tempfile.mkdtemp(prefix=prefix)
+        os.environ["DATABASE_URL"] = f"sqlite:///{scratch}/bench.db"
+    # Outbox messages are delivered to the in-memory provider, not the console.
+    os.environ.setdefault("SMS_PROVIDER", "fake")
+    sys.path.insert(0, os.getcwd())
+    return os.environ["DATABASE_URL"]
+
+def user_phone(index: int) -> str:
+    return f"0807{index:07d}"
+
+def seed(users: int, stations: int, transactions: int, seed_value: int = 7, chunk_size: int = 10_000) -> Dict[str, int]:
+    # Core inserts with one precomputed PIN hash, so seeding cost does not
+    # depend on bcrypt. Ledger and settlement rollups are rebuilt at the end.
+    from app.auth import get_password_hash
+    from app.database import SessionLocal, create_tables, engine
+    from app.ledger import CreditLedger
+    from app.models import PartnerStation, Payment, Transaction, User
+    from app.settlements import SettlementRollup
+
+    create_tables()
+    rng = random.Random(seed_value)
+    pin_hash = get_password_hash(BENCH_PIN)
+    now = datetime.utcnow()
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"phone": user_phone(i), "first_name": "Bench", "last_name": f"User{i}", "pin_hash": pin_hash,
+             "credit_limit": 1_000_000.0, "kyc_level": 1, "status": "active", "user_type": "consumer",
+             "created_at": now, "updated_at": now}
+            for i in range(users)
+        ] + [
+            {"phone": ADMIN_PHONE, "first_name": "Bench", "last_name": "Admin", "pin_hash": pin_hash,
+             "credit_limit": 1_000_000.0, "kyc_level": 3, "status": "active", "user_type": "admin",
+             "created_at": now, "updated_at": now}
+        ])
+        conn.execute(PartnerStation.__table__.insert(), [
+            {"name": f"Bench Station {i}", "address": "Lagos", "external_id": f"bench-{i}",
+             "latitude": 6.4 + rng.random() * 0.3, "longitude": 3.2 + rng.random() * 0.4,
+             "status": "active", "created_at": now, "updated_at": now}
+            for i in range(stations)
+        ])
+
+    statuses = ("pending", "completed", "completed", "expired")
+    for offset in range(0, transactions, chunk_size):
+        tx_rows = []
+        payment_rows = []
+        for i in range(offset, min(transactions, offset + chunk_size)):
+            created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+            status = statuses[i % len(statuses)]
+            tx_rows.append({
+                "id": i + 1, "user_id": rng.randint(1, users), "station_id": rng.randint(1, stations),
+                "amount": float(rng.choice((1000, 2000, 5000))), "qr_code": f"SEED{i:08d}", "status": status,
+                "created_at": created_at, "expires_at": created_at + timedelta(hours=24),
+                "completed_at": created_at + timedelta(minutes=30) if status == "completed" else None,
+            })
+            if status == "completed" and i % 2:
+                payment_rows.append({
+                    "transaction_id": i + 1, "user_id": tx_rows[-1]["user_id"], "amount": tx_rows[-1]["amount"],
+                    "method": "USSD", "reference": f"SEEDPAY{i:08d}", "status": "completed",
+                    "processed_at": created_at + timedelta(days=1), "created_at": created_at + timedelta(days=1),
+                })
+        with engine.begin() as conn:
+            conn.execute(Transaction.__table__.insert(), tx_rows)
+            if payment_rows:
+                conn.execute(Payment.__table__.insert(), payment_rows)
+
+    with SessionLocal() as db:
+        CreditLedger.reconcile(db)
+        SettlementRollup.rebuild(db)
+    return {"users": users, "stations": stations, "transactions": transactions}
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(samples: List[float], elapsed: Optional[float] = None) -> Dict[str, float]:
+    # Latencies in milliseconds; ops_per_second over wall time when given.
+    if not samples:
+        return {"count": 0}
+    summary = {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+    total = elapsed if elapsed is not None else sum(samples)
+    if total > 0:
+        summary["ops_per_second"] = round(len(samples) / total, 1)
+    return summary
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_report(path: Optional[str], kind: str, params: dict, results: dict) -> dict:
+    report = {
+        "kind": kind,
+        "revision": git_revision(),
+        "recorded_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "params": params,
+        "results": results,
+    }
+    if path:
+        with open(path, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write("\n")
+    return report
@@ -0,0 +1,35 @@
+import argparse
+import json
+
+# Diffs two benchmark reports (micro or load) written with --output:
+#   python -m benchmarks.compare before.json after.json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+def entries(report: dict) -> dict:
+    results = report["results"]
+    return results.get("routes", results)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    print(f"{before.get('revision')} -> {after.get('revision')}")
+    old, new = entries(before), entries(after)
+    for name in sorted(set(old) | set(new)):
+        if name not in old or name not in new:
+            print(f"{name:<48} only in {'after' if name in new else 'before'}")
+            continue
+        changes = []
+        for metric in METRICS:
+            previous, current = old[name].get(metric), new[name].get(metric)
+            if previous and current is not None:
+                changes.append(f"{metric} {previous:.2f} -> {current:.2f} ({(current - previous) / previous:+.0%})")
+        print(f"{name:<48} " + "  ".join(changes))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Exports a large synthetic transactions table through stream_export and
+# asserts resident memory stays flat while the rows go by. Run from
+# fan_backend/:
+#   python -m benchmarks.export_stream --rows 5000000 --format csv
+
+def rss_mb() -> float:
+    # Anonymous resident memory only: SQLite's mmap I/O maps the database
+    # file into the process, and those clean file-backed pages would
+    # otherwise show up as "growth" proportional to the rows read.
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("RssAnon not available")
+
+def seed(rows: int, chunk_size: int = 50_000):
+    from app.database import engine
+    from app.models import PartnerStation, Transaction, User
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), {"phone": "08000000000", "first_name": "Export", "last_name": "Bench", "pin_hash": "x"})
+        conn.execute(PartnerStation.__table__.insert(), {"name": "Bench", "address": "Lagos", "latitude": 6.5, "longitude": 3.4})
+    started = datetime(2024, 1, 1)
+    statuses = ("pending", "completed", "expired")
+    for offset in range(0, rows, chunk_size):
+        batch = []
+        for i in range(offset, min(rows, offset + chunk_size)):
+            created_at = started + timedelta(seconds=i)
+            batch.append({
+                "user_id": 1, "station_id": 1, "amount": 1000.0 + i % 500, "qr_code": f"Q{i:011d}",
+                "status": statuses[i % 3], "created_at": created_at, "expires_at": created_at + timedelta(hours=24),
+            })
+        with engine.begin() as conn:
+            conn.execute(Transaction.__table__.insert(), batch)
+
+async def export(args) -> dict:
+    from app.export import build_export_query, stream_export
+
+    stmt = build_export_query("transactions")
+    samples = []
+    exported_bytes = 0
+    started = time.perf_counter()
+    async for chunk in stream_export(stmt, args.format, batch_size=args.batch_size):
+        exported_bytes += len(chunk)
+        samples.append(rss_mb())
+    elapsed = time.perf_counter() - started
+    # Ignore warm-up (driver buffers, first allocations) when judging growth.
+    baseline = samples[min(len(samples) - 1, len(samples) // 10)]
+    return {
+        "chunks": len(samples),
+        "exported_mb": round(exported_bytes / (1024 * 1024), 1),
+        "seconds": round(elapsed, 1),
+        "rows_per_second": round(args.rows / elapsed),
+        "rss_baseline_mb": round(baseline, 1),
+        "rss_peak_mb": round(max(samples), 1),
+        "rss_growth_mb": round(max(samples) - baseline, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming export memory benchmark")
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--max-growth-mb", type=float, default=32.0)
+    args = parser.parse_args()
+
+    if "DATABASE_URL" not in os.environ:
+        scratch = tempfile.mkdtemp(prefix="fan-export-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{scratch}/export.db"
+    sys.path.insert(0, os.getcwd())
+
+    from app.database import create_tables
+
+    create_tables()
+    seeding_started = time.perf_counter()
+    seed(args.rows)
+    print(f"seeded {args.rows} rows in {time.perf_counter() - seeding_started:.1f}s")
+
+    result = asyncio.run(export(args))
+    print(result)
+    assert result["rss_growth_mb"] <= args.max_growth_mb, (
+        f"RSS grew {result['rss_growth_mb']} MB while exporting (limit {args.max_growth_mb} MB)"
+    )
+    print("ok: resident memory stayed flat")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import time
+import uuid
+from collections import defaultdict
+
+from benchmarks.common import ADMIN_PHONE, BENCH_PIN, seed, summarize, use_scratch_database, write_report
+
+# In-process ASGI load generator. Each virtual user repeatedly runs the
+# consumer flow (register -> login -> create advance -> scan -> pay, plus
+# the read endpoints around it); one admin user exercises the back-office
+# endpoints alongside. Per-route throughput and p50/p95/p99 go to a JSON
+# report. Run from fan_backend/:
+#   python -m benchmarks.load --virtual-users 20 --iterations 5 --output load.json
+
+class Recorder:
+    def __init__(self, client):
+        self.client = client
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, route: str, method: str, url: str, expected=(200,), **kwargs):
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.samples[route].append(time.perf_counter() - started)
+        if response.status_code not in expected:
+            self.errors[route] += 1
+        return response
+
+async def consumer_flow(recorder: Recorder, worker: int, iteration: int):
+    call = recorder.call
+    phone = f"0803{worker:03d}{iteration:04d}"
+    await call("POST /auth/send-otp", "POST", "/auth/send-otp", json={"phone": phone})
+    await call("POST /auth/verify-otp", "POST", "/auth/verify-otp", expected=(400,),
+               json={"phone": phone, "otp_code": "000000"})
+    registered = (await call("POST /auth/register", "POST", "/auth/register",
+                             json={"phone": phone, "first_name": "Load", "last_name": "Test", "pin": BENCH_PIN})).json()
+    login = (await call("POST /auth/login", "POST", "/auth/login", json={"phone": phone, "pin": BENCH_PIN})).json()
+    headers = {"Authorization": f"Bearer {login['access_token']}"}
+    await call("POST /auth/refresh", "POST", "/auth/refresh", json={"refresh_token": registered["refresh_token"]})
+    await call("GET /auth/me", "GET", "/auth/me", headers=headers)
+
+    stations = await call("GET /stations", "GET", "/stations")
+    await call("GET /stations (304)", "GET", "/stations", expected=(304,),
+               headers={"If-None-Match": stations.headers.get("etag", "")})
+    await call("GET /stations?since", "GET", "/stations", params={"since": "2024-01-01T00:00:00"})
+    await call("GET /stations/nearby", "GET", "/stations/nearby", params={"latitude": 6.5, "longitude": 3.35, "radius": 10})
+
+    advance = (await call("POST /transactions/create", "POST", "/transactions/create", json={"amount": 500},
+                          headers={**headers, "Idempotency-Key": uuid.uuid4().hex})).json()
+    await call("GET /transactions/my", "GET", "/transactions/my", headers=headers)
+    await call("GET /transactions/{id}/qr.png", "GET", f"/transactions/{advance['id']}/qr.png", headers=headers)
+    await call("GET /transactions/{id}/qr.svg", "GET", f"/transactions/{advance['id']}/qr.svg", headers=headers)
+    await call("POST /transactions/scan-qr", "POST", "/transactions/scan-qr",
+               json={"qr_code": advance["qr_code"], "station_id": 1})
+    await call("POST /payments/create", "POST", "/payments/create", headers=headers,
+               json={"transaction_id": advance["id"], "amount": 500, "method": "USSD"})
+    await call("GET /payments/my", "GET", "/payments/my", headers=headers)
+
+    queued = [
+        (await call("POST /transactions/create", "POST", "/transactions/create", json={"amount": 200}, headers=headers)).json()
+        for _ in range(3)
+    ]
+    await call("POST /transactions/scan-qr/batch", "POST", "/transactions/scan-qr/batch",
+               json={"scans": [{"qr_code": item["qr_code"], "station_id": 2} for item in queued]})
+
+async def admin_flow(recorder: Recorder, headers: dict, iteration: int):
+    call = recorder.call
+    await call("GET /", "GET", "/")
+    await call("GET /metrics", "GET", "/metrics")
+    await call("POST /stations/create", "POST", "/stations/create",
+               json={"name": f"Load {iteration}", "address": "Lagos", "latitude": 6.45, "longitude": 3.4})
+    await call("POST /stations/bulk", "POST", "/stations/bulk", headers=headers, json=[
+        {"external_id": f"load-{iteration}-{i}", "name": f"Bulk {i}", "address": "Lagos", "latitude": 6.5, "longitude": 3.3}
+        for i in range(50)
+    ])
+    await call("GET /stations/{id}/settlements", "GET", "/stations/1/settlements", headers=headers)
+    await call("GET /admin/exports/{dataset}", "GET", "/admin/exports/transactions", headers=headers,
+               params={"format": "csv", "station_id": 1})
+
+async def run(args) -> dict:
+    import httpx
+    from app.main import app, shutdown_event, startup_event
+
+    await startup_event()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as client:
+            recorder = Recorder(client)
+            admin = (await client.post("/auth/login", json={"phone": ADMIN_PHONE, "pin": BENCH_PIN})).json()
+            admin_headers = {"Authorization": f"Bearer {admin['access_token']}"}
+
+            async def virtual_user(worker):
+                for iteration in range(args.iterations):
+                    await consumer_flow(recorder, worker, iteration)
+
+            async def admin_user():
+                for iteration in range(args.iterations):
+                    await admin_flow(recorder, admin_headers, iteration)
+
+            started = time.perf_counter()
+            await asyncio.gather(admin_user(), *(virtual_user(worker) for worker in range(args.virtual_users)))
+            elapsed = time.perf_counter() - started
+    finally:
+        await shutdown_event()
+
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        routes[route] = {**summarize(samples, elapsed), "errors": recorder.errors.get(route, 0)}
+        print(f"{route:<36} n={len(samples):<5} p50 {routes[route]['p50_ms']:>9.1f} ms  "
+              f"p95 {routes[route]['p95_ms']:>9.1f} ms  p99 {routes[route]['p99_ms']:>9.1f} ms  errors {routes[route]['errors']}")
+    total = sum(len(samples) for samples in recorder.samples.values())
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "requests": total,
+        "requests_per_second": round(total / elapsed, 1),
+        "errors": sum(recorder.errors.values()),
+        "routes": routes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process ASGI load generator")
+    parser.add_argument("--users", type=int, default=1000, help="seeded users")
+    parser.add_argument("--stations", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=50_000)
+    parser.add_argument("--virtual-users", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=5, help="flows per virtual user")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    use_scratch_database("fan-load-")
+    seeded = seed(args.users, args.stations, args.transactions)
+    results = asyncio.run(run(args))
+    write_report(args.output, "load", {**vars(args), "seeded": seeded}, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Run from fan_backend/: PIN_HASH_WORKERS=0 python -m benchmarks.login_storm
+# reproduces the old behaviour (bcrypt on the request threadpool); the
+# default uses the dedicated process pool.
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def run(args):
+    import httpx
+    from app.main import app, startup_event, shutdown_event
+    from app.hashing import password_hasher
+
+    await startup_event()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            phones = [f"0809{i:07d}" for i in range(args.users)]
+            for phone in phones:
+                response = await client.post(
+                    "/auth/register",
+                    json={"phone": phone, "first_name": "Load", "last_name": "Test", "pin": "1234"},
+                )
+                response.raise_for_status()
+
+            stop = asyncio.Event()
+            login_statuses = []
+
+            async def login_worker(worker_id):
+                i = worker_id
+                while not stop.is_set():
+                    response = await client.post(
+                        "/auth/login", json={"phone": phones[i % len(phones)], "pin": "1234"}
+                    )
+                    login_statuses.append(response.status_code)
+                    i += args.login_concurrency
+
+            async def probe_stations():
+                samples = []
+                for _ in range(args.probes):
+                    started = time.perf_counter()
+                    response = await client.get("/stations")
+                    response.raise_for_status()
+                    samples.append((time.perf_counter() - started) * 1000)
+                    await asyncio.sleep(args.probe_interval)
+                return samples
+
+            baseline = await probe_stations()
+            workers = [asyncio.create_task(login_worker(i)) for i in range(args.login_concurrency)]
+            await asyncio.sleep(0.5)
+            storm = await probe_stations()
+            stop.set()
+            await asyncio.gather(*workers)
+    finally:
+        await shutdown_event()
+
+    report = {
+        "pin_hash_workers": password_hasher.workers,
+        "login_concurrency": args.login_concurrency,
+        "logins": len(login_statuses),
+        "logins_rejected_503": login_statuses.count(503),
+        "stations_idle_ms": {"p50": statistics.median(baseline), "p99": percentile(baseline, 0.99)},
+        "stations_storm_ms": {"p50": statistics.median(storm), "p99": percentile(storm, 0.99)},
+    }
+    print(json.dumps(report, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="p99 latency of /stations during a login storm")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--login-concurrency", type=int, default=64)
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    # The app uses a relative SQLite path, so run inside a scratch directory.
+    sys.path.insert(0, os.getcwd())
+    os.chdir(tempfile.mkdtemp(prefix="fan-bench-"))
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
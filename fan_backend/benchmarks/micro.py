@@ -0,0 +1,116 @@
+import argparse
+import itertools
+import os
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import BENCH_PIN, seed, summarize, use_scratch_database, user_phone, write_report
+
+# Service-level micro-benchmarks against an isolated, seeded SQLite
+# database. Run from fan_backend/:
+#   python -m benchmarks.micro --users 1000 --stations 2000 --transactions 100000 --output micro.json
+
+def measure(name, func, iterations, results):
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - started)
+    results[name] = summarize(samples)
+    print(f"{name:<48} p50 {results[name]['p50_ms']:>9.3f} ms  p99 {results[name]['p99_ms']:>9.3f} ms")
+
+def run(args) -> dict:
+    from app.database import SessionLocal
+    from app.services import AuthService, PaymentService, StationService, TransactionService
+    from app.velocity import velocity_tracker
+
+    results = {}
+    db = SessionLocal()
+    counter = itertools.count()
+    users = args.users
+
+    # AuthService
+    measure("AuthService.get_user_by_phone",
+            lambda i: AuthService.get_user_by_phone(user_phone(i % users), db), args.iterations, results)
+    measure("AuthService.authenticate_user",
+            lambda i: AuthService.authenticate_user(user_phone(i % users), BENCH_PIN, db), args.bcrypt_iterations, results)
+    measure("AuthService.create_user",
+            lambda i: AuthService.create_user(f"0806{next(counter):07d}", "Micro", "Bench", BENCH_PIN, db),
+            args.bcrypt_iterations, results)
+    measure("AuthService.send_otp",
+            lambda i: AuthService.send_otp(f"0805{i:07d}", db), args.iterations, results)
+
+    # TransactionService
+    created = []
+    measure("TransactionService.create_advance_request",
+            lambda i: created.append(TransactionService.create_advance_request(1 + i % users, 1000.0, None, db)),
+            args.iterations, results)
+    measure("TransactionService.validate_qr_scan",
+            lambda i: TransactionService.validate_qr_scan(created[i].qr_code, 1 + i % args.stations, db),
+            args.iterations, results)
+    batch_codes = [
+        TransactionService.create_advance_request(1 + i % users, 1000.0, None, db).qr_code
+        for i in range(args.batch_size * args.batch_iterations)
+    ]
+    measure(f"TransactionService.redeem_qr_batch[{args.batch_size}]",
+            lambda i: TransactionService.redeem_qr_batch(
+                [(code, 1) for code in batch_codes[i * args.batch_size:(i + 1) * args.batch_size]], db
+            ), args.batch_iterations, results)
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    measure("TransactionService.render_qr_image[png]",
+            lambda i: TransactionService.render_qr_image(f"BENCH{i:07d}", "png"), args.render_iterations, results)
+    measure("TransactionService.get_qr_image[png,cached]",
+            lambda i: TransactionService.get_qr_image("BENCHCACHED", "png", expires_at), args.iterations, results)
+
+    measure("VelocityTracker.hydrate", lambda i: velocity_tracker.hydrate(db), 3, results)
+    measure("VelocityTracker.score",
+            lambda i: velocity_tracker.score(1 + i % users, 1000.0, db), args.iterations, results)
+
+    # PaymentService
+    measure("PaymentService.process_payment",
+            lambda i: PaymentService.process_payment(created[i].id, created[i].user_id, 500.0, "USSD", db),
+            args.iterations, results)
+
+    # StationService
+    measure("StationService.find_nearby_stations[10km]",
+            lambda i: StationService.find_nearby_stations(6.5, 3.35, 10.0, db), args.iterations, results)
+    measure("StationService.create_station",
+            lambda i: StationService.create_station(f"Micro {i}", "Lagos", 6.5, 3.4, db), args.iterations // 10 or 1, results)
+    bulk_rows = [
+        {"external_id": f"micro-{i}", "name": f"Bulk {i}", "address": "Lagos", "latitude": 6.5, "longitude": 3.4}
+        for i in range(args.bulk_size)
+    ]
+    measure(f"StationService.validate_station_rows[{args.bulk_size}]",
+            lambda i: StationService.validate_station_rows(bulk_rows), 5, results)
+    valid_rows, _ = StationService.validate_station_rows(bulk_rows)
+    measure(f"StationService.bulk_upsert_stations[{args.bulk_size}]",
+            lambda i: StationService.bulk_upsert_stations(valid_rows, db), 5, results)
+
+    db.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Service micro-benchmarks")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--stations", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=50_000)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--bcrypt-iterations", type=int, default=10)
+    parser.add_argument("--render-iterations", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--batch-iterations", type=int, default=10)
+    parser.add_argument("--bulk-size", type=int, default=2000)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    use_scratch_database("fan-micro-")
+    # Velocity checks still run (and are timed) inside create_advance_request,
+    # but the benchmark's bursts per user must not be declined.
+    for limit in ("VELOCITY_MAX_PER_HOUR", "VELOCITY_MAX_PER_DAY", "VELOCITY_MAX_STATIONS_PER_DAY"):
+        os.environ.setdefault(limit, str(10 ** 9))
+    seeded = seed(args.users, args.stations, args.transactions)
+    results = run(args)
+    write_report(args.output, "micro", {**vars(args), "seeded": seeded}, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import random
+import statistics
+import time
+
+from app.geo import StationIndex, haversine_km
+
+# Rough bounding box of Nigeria, where partner stations are onboarded.
+LAT_RANGE = (4.2, 13.9)
+LON_RANGE = (2.7, 14.7)
+
+def synthetic_stations(count: int, seed: int):
+    rng = random.Random(seed)
+    return [(i, rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for i in range(1, count + 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark StationIndex nearby lookups")
+    parser.add_argument("--stations", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=5_000)
+    parser.add_argument("--radius", type=float, default=10.0)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    points = synthetic_stations(args.stations, args.seed)
+    index = StationIndex()
+    started = time.perf_counter()
+    index.rebuild(points)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(args.seed + 1)
+    queries = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(args.queries)]
+
+    timings = []
+    for latitude, longitude in queries:
+        started = time.perf_counter()
+        index.nearest(latitude, longitude, radius_km=args.radius, limit=args.limit)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    latitude, longitude = queries[0]
+    expected = sorted(
+        (haversine_km(latitude, longitude, lat, lon), station_id) for station_id, lat, lon in points
+    )
+    expected = [station_id for distance, station_id in expected if distance <= args.radius][:args.limit]
+    got = [station_id for station_id, _ in index.nearest(latitude, longitude, radius_km=args.radius, limit=args.limit)]
+    assert got == expected, "index results differ from brute-force haversine scan"
+
+    timings.sort()
+    print(f"stations={args.stations} build={build_ms:.1f}ms radius={args.radius}km limit={args.limit}")
+    print(
+        f"query mean={statistics.fmean(timings):.4f}ms "
+        f"p50={timings[len(timings) // 2]:.4f}ms "
+        f"p99={timings[int(len(timings) * 0.99)]:.4f}ms"
+    )
+
+if __name__ == "__main__":
+    main()
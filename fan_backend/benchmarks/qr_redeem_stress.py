@@ -0,0 +1,55 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Fires many concurrent scans of the same QR code at validate_qr_scan and
+# asserts exactly one of them redeems it. Run from fan_backend/:
+#   python -m benchmarks.qr_redeem_stress --scanners 32 --rounds 20
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent QR redemption stress test")
+    parser.add_argument("--scanners", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    if "DATABASE_URL" not in os.environ:
+        scratch = tempfile.mkdtemp(prefix="fan-stress-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{scratch}/stress.db"
+    os.environ.setdefault("DB_POOL_SIZE", str(args.scanners))
+    # A single synthetic user issues every advance.
+    os.environ.setdefault("VELOCITY_CHECKS", "false")
+    sys.path.insert(0, os.getcwd())
+
+    from app.database import SessionLocal, create_tables
+    from app.models import PartnerStation, User
+    from app.services import TransactionService
+
+    create_tables()
+    with SessionLocal() as db:
+        user = User(phone="08000000000", first_name="Stress", last_name="Test", pin_hash="x")
+        station = PartnerStation(name="Stress Station", address="Lagos", latitude=6.5, longitude=3.4)
+        db.add_all([user, station])
+        db.commit()
+        user_id, station_id = user.id, station.id
+
+    def scan(qr_code, barrier):
+        barrier.wait()
+        with SessionLocal() as db:
+            return TransactionService.validate_qr_scan(qr_code, station_id, db) is not None
+
+    with ThreadPoolExecutor(max_workers=args.scanners) as pool:
+        for round_number in range(args.rounds):
+            with SessionLocal() as db:
+                qr_code = TransactionService.create_advance_request(user_id, 1000.0, None, db).qr_code
+            barrier = threading.Barrier(args.scanners)
+            results = list(pool.map(lambda _: scan(qr_code, barrier), range(args.scanners)))
+            winners = sum(results)
+            assert winners == 1, f"round {round_number}: {winners} scanners redeemed {qr_code}"
+
+    print(f"ok: {args.rounds} rounds x {args.scanners} concurrent scanners, exactly one winner each")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import time
+from typing import List
+
+from benchmarks.common import seed, summarize, use_scratch_database, write_report
+
+# List-endpoint serialization: today's response_model path (ORM rows ->
+# pydantic models via from_attributes -> JSONResponse's json.dumps) against
+# the RowEncoder fast path (column tuples -> orjson), with the query included
+# and on its own. Every run also checks the two paths produce identical bytes.
+# Run from fan_backend/:
+#   python -m benchmarks.serialization --rows 200 5000 --output serialization.json
+
+def response_model_bytes(adapter, objects) -> bytes:
+    # What FastAPI does for response_model=List[schema] when a handler
+    # returns ORM objects.
+    content = adapter.dump_python(adapter.validate_python(objects, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def measure(name, rows, func, iterations, results):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    summary = summarize(samples)
+    summary["rows_per_second"] = round(rows * summary["count"] / sum(samples))
+    results[name] = summary
+    print(f"{name:<44} p50 {summary['p50_ms']:>9.3f} ms  {summary['rows_per_second']:>12,} rows/s")
+
+def run(args) -> dict:
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from app.database import SessionLocal
+    from app.models import Payment, PartnerStation, Transaction
+    from app.schemas import Payment as PaymentSchema, PartnerStation as PartnerStationSchema, Transaction as TransactionSchema
+    from app.serialization import payment_rows, station_rows, transaction_rows
+
+    datasets = (
+        ("transactions", Transaction, TransactionSchema, transaction_rows),
+        ("payments", Payment, PaymentSchema, payment_rows),
+        ("stations", PartnerStation, PartnerStationSchema, station_rows),
+    )
+    results = {}
+    with SessionLocal() as db:
+        for name, model, schema, encoder in datasets:
+            adapter = TypeAdapter(List[schema])
+            for rows in args.rows:
+                orm_query = select(model).order_by(model.id).limit(rows)
+                row_query = encoder.select().order_by(model.id).limit(rows)
+                objects = db.scalars(orm_query).all()
+                tuples = db.execute(row_query).all()
+                if len(tuples) < rows:
+                    continue
+                expected = response_model_bytes(adapter, objects)
+                if encoder.encode(tuples) != expected:
+                    raise AssertionError(f"{name}: fast path bytes differ from response_model output")
+                db.expunge_all()
+                iterations = max(3, args.row_budget // rows)
+
+                measure(f"{name}[{rows}] response_model encode", rows,
+                        lambda: response_model_bytes(adapter, objects), iterations, results)
+                measure(f"{name}[{rows}] row encoder encode", rows,
+                        lambda: encoder.encode(tuples), iterations, results)
+
+                def orm_path():
+                    response_model_bytes(adapter, db.scalars(orm_query).all())
+                    db.expunge_all()
+                measure(f"{name}[{rows}] response_model query+encode", rows, orm_path, iterations, results)
+                measure(f"{name}[{rows}] row encoder query+encode", rows,
+                        lambda: encoder.encode(db.execute(row_query).all()), iterations, results)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="List endpoint serialization throughput")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--stations", type=int, default=5000)
+    parser.add_argument("--transactions", type=int, default=50_000)
+    parser.add_argument("--rows", type=int, nargs="+", default=[200, 5000])
+    parser.add_argument("--row-budget", type=int, default=200_000, help="rows encoded per measurement")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    use_scratch_database("fan-serialization-")
+    seeded = seed(args.users, args.stations, args.transactions)
+    results = run(args)
+    write_report(args.output, "serialization", {**vars(args), "seeded": seeded}, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import seed, use_scratch_database, user_phone, write_report
+
+# Cold-start benchmark: each run is a fresh interpreter that imports
+# app.main, runs the startup hooks, waits for the background cache warm-up
+# and then times the first request to a few representative routes. Run from
+# fan_backend/:
+#   python -m benchmarks.startup --runs 5 --schema-mode migrations --output startup.json
+# Compare CACHE_WARMUP=false / LOAD_DOTENV=false runs with benchmarks.compare.
+
+HEAVY_MODULES = ("qrcode", "PIL", "passlib", "dotenv", "alembic")
+
+async def first_requests(phone: str, transaction_id: int) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.background import _tasks
+    from app.main import app, shutdown_event, startup_event
+
+    timings = {}
+    started = time.perf_counter()
+    await startup_event()
+    timings["startup"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await asyncio.gather(*(task for task in _tasks if task.get_name() == "cache-warmup"))
+    timings["cache_warmup"] = time.perf_counter() - started
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': phone})}"}
+    requests = [
+        ("GET /stations", "/stations", {}),
+        ("GET /stations/nearby", "/stations/nearby?latitude=6.5&longitude=3.35&radius=10", {}),
+        ("GET /auth/me", "/auth/me", headers),
+        ("GET /transactions/{id}/qr.png", f"/transactions/{transaction_id}/qr.png", headers),
+    ]
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for route, url, request_headers in requests:
+                started = time.perf_counter()
+                response = await client.get(url, headers=request_headers)
+                timings[route] = time.perf_counter() - started
+                if response.status_code != 200:
+                    raise RuntimeError(f"{route} returned {response.status_code}")
+    finally:
+        await shutdown_event()
+    return timings
+
+def child(phone: str, transaction_id: int):
+    sys.path.insert(0, os.getcwd())
+    started = time.perf_counter()
+    import app.main  # noqa: F401
+    timings = {"import": time.perf_counter() - started}
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    timings.update(asyncio.run(first_requests(phone, transaction_id)))
+    print(json.dumps({"timings": timings, "loaded_at_import": loaded}))
+
+def prepare(args):
+    from app.database import SessionLocal
+    from app.models import Transaction, User
+
+    seeded = seed(args.users, args.stations, args.transactions)
+    if args.schema_mode == "migrations":
+        from alembic import command
+        from alembic.config import Config
+        # The scratch database was built by create_all, which matches head.
+        command.stamp(Config("alembic.ini"), "head")
+    with SessionLocal() as db:
+        phone = user_phone(0)
+        user = db.query(User).filter(User.phone == phone).one()
+        transaction = Transaction(user_id=user.id, amount=500.0, qr_code="STARTUPBENCH", status="pending",
+                                  expires_at=datetime.utcnow() + timedelta(days=1))
+        db.add(transaction)
+        db.commit()
+        return seeded, phone, transaction.id
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import and first-request latency")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--stations", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=50_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--schema-mode", choices=("create_all", "migrations"), default="create_all")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--child", nargs=2, metavar=("PHONE", "TRANSACTION_ID"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+
+    use_scratch_database("fan-startup-")
+    seeded, phone, transaction_id = prepare(args)
+    env = {**os.environ, "SCHEMA_MODE": args.schema_mode}
+    runs = []
+    for run in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", phone, str(transaction_id)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    results = {}
+    for name in runs[0]["timings"]:
+        samples = [run["timings"][name] * 1000 for run in runs]
+        results[name] = {
+            "count": len(samples),
+            "p50_ms": round(statistics.median(samples), 3),
+            "min_ms": round(min(samples), 3),
+            "max_ms": round(max(samples), 3),
+        }
+        print(f"{name:<36} median {results[name]['p50_ms']:>9.1f} ms  min {results[name]['min_ms']:>9.1f} ms  "
+              f"max {results[name]['max_ms']:>9.1f} ms")
+    print(f"heavy modules loaded by import: {', '.join(runs[0]['loaded_at_import']) or 'none'}")
+    write_report(args.output, "startup", {**vars(args), "seeded": seeded,
+                                          "loaded_at_import": runs[0]["loaded_at_import"]}, results)
+
+if __name__ == "__main__":
+    main()
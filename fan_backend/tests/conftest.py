@@ -0,0 +1,64 @@
+import os
+import random
+import tempfile
+
+# The app reads its settings at import time, so the test database and
+# providers are configured before anything under app/ is imported.
+_database_dir = tempfile.mkdtemp(prefix="fan-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_database_dir}/test.db"
+os.environ["LOAD_DOTENV"] = "false"
+os.environ["SCHEMA_MODE"] = "create_all"
+os.environ["SMS_PROVIDER"] = "fake"
+os.environ["VELOCITY_CHECKS"] = "false"
+os.environ["CACHE_WARMUP"] = "false"
+for name in ("ASYNC_DATABASE_URL", "READ_DATABASE_URL", "ASYNC_READ_DATABASE_URL"):
+    os.environ.pop(name, None)
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal, create_tables
+from app.main import app
+from app.models import User
+
+def random_phone() -> str:
+    return "070" + "".join(random.choices("0123456789", k=8))
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    create_tables()
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+@pytest.fixture
+def make_user(db):
+    def make_user(credit_limit: float = 5000.0) -> User:
+        user = User(phone=random_phone(), first_name="Test", last_name="User", credit_limit=credit_limit)
+        db.add(user)
+        db.commit()
+        return user
+    return make_user
+
+@pytest.fixture
+def register(client):
+    def register() -> dict:
+        response = client.post("/auth/register", json={
+            "phone": random_phone(), "first_name": "Test", "last_name": "User", "pin": "1234"
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+    return register
+
+@pytest.fixture
+def auth_headers(register):
+    def auth_headers() -> dict:
+        return {"Authorization": f"Bearer {register()['access_token']}"}
+    return auth_headers
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+from app import auth
+from app.auth import ALGORITHM, DEFAULT_KID, SECRET_KEY, get_password_hash, load_signing_keys, token_cache, user_cache
+from app.models import User
+
+def signed(kid: str, secret: str, phone: str) -> str:
+    claims = {"sub": phone, "typ": "access", "exp": datetime.utcnow() + timedelta(minutes=5)}
+    return jwt.encode(claims, secret, algorithm=ALGORITHM, headers={"kid": kid})
+
+def me(client, token: str):
+    return client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+
+def test_secret_key_only_verifies_when_default_is_allowed():
+    assert load_signing_keys("") == {DEFAULT_KID: SECRET_KEY}
+    assert load_signing_keys("2024a:one,2024b:two") == {"2024a": "one", "2024b": "two"}
+    assert load_signing_keys("default,2024a:one") == {DEFAULT_KID: SECRET_KEY, "2024a": "one"}
+
+def test_default_kid_is_rejected_once_keys_are_configured(client, register, monkeypatch):
+    phone = register()["user"]["phone"]
+    monkeypatch.setattr(auth, "SIGNING_KEYS", load_signing_keys("2024a:rotated-secret"))
+    monkeypatch.setattr(auth, "JWT_ACTIVE_KID", "2024a")
+
+    assert me(client, signed(DEFAULT_KID, SECRET_KEY, phone)).status_code == 401
+    assert me(client, signed("2024a", "rotated-secret", phone)).status_code == 200
+
+def test_unknown_kid_is_rejected(client, register):
+    phone = register()["user"]["phone"]
+
+    assert me(client, signed("nosuchkid", SECRET_KEY, phone)).status_code == 401
+
+def test_retired_kid_drops_the_cached_token(client, register, monkeypatch):
+    phone = register()["user"]["phone"]
+    monkeypatch.setattr(auth, "SIGNING_KEYS", {**auth.SIGNING_KEYS, "2024a": "old-secret"})
+    token = signed("2024a", "old-secret", phone)
+    assert me(client, token).status_code == 200
+    assert token_cache.get(token, count=False) is not None
+
+    monkeypatch.setattr(auth, "SIGNING_KEYS", {DEFAULT_KID: SECRET_KEY})
+
+    assert me(client, token).status_code == 401
+    assert token_cache.get(token, count=False) is None
+
+def test_refresh_is_rejected_after_a_pin_change(client, register, db):
+    tokens = register()
+    refreshed = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert refreshed.status_code == 200
+    assert me(client, tokens["access_token"]).status_code == 200
+    assert user_cache.get(tokens["user"]["phone"], count=False) is not None
+
+    user = db.query(User).filter_by(phone=tokens["user"]["phone"]).one()
+    user.pin_hash = get_password_hash("5678")
+    db.commit()
+
+    assert user_cache.get(user.phone, count=False) is None
+    for refresh_token in (tokens["refresh_token"], refreshed.json()["refresh_token"]):
+        assert client.post("/auth/refresh", json={"refresh_token": refresh_token}).status_code == 401
+    login = client.post("/auth/login", json={"phone": user.phone, "pin": "5678"})
+    assert client.post("/auth/refresh", json={"refresh_token": login.json()["refresh_token"]}).status_code == 200
@@ -0,0 +1,26 @@
+import asyncio
+import os
+import signal
+import time
+
+from app.hashing import PasswordHasherPool
+
+def test_pool_recovers_after_a_worker_dies():
+    hasher = PasswordHasherPool(workers=1)
+
+    async def scenario():
+        hashed = await hasher.hash("1234")
+        broken = hasher._executor
+        for process in list(broken._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while not broken._broken and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert await hasher.verify("1234", hashed)
+        assert hasher._executor is not broken
+        return await hasher.hash("5678")
+
+    try:
+        assert asyncio.run(scenario()).startswith("$2")
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.idempotency import IDEMPOTENCY_REPLAYED_HEADER, idempotency_store, request_fingerprint
+from app.models import IdempotencyKey, Transaction
+from app.schemas import TransactionCreate
+
+def test_repeat_replays_the_first_response(client, auth_headers, db):
+    headers = {**auth_headers(), "Idempotency-Key": "advance-1"}
+
+    first = client.post("/transactions/create", headers=headers, json={"amount": 100})
+    repeat = client.post("/transactions/create", headers=headers, json={"amount": 100})
+
+    assert first.status_code == repeat.status_code == 200
+    assert repeat.json() == first.json()
+    assert IDEMPOTENCY_REPLAYED_HEADER not in first.headers
+    assert repeat.headers[IDEMPOTENCY_REPLAYED_HEADER] == "true"
+    user_id = first.json()["user_id"]
+    assert db.query(Transaction).filter_by(user_id=user_id).count() == 1
+
+def test_reused_key_with_a_different_body_is_rejected(client, auth_headers):
+    headers = {**auth_headers(), "Idempotency-Key": "advance-2"}
+
+    assert client.post("/transactions/create", headers=headers, json={"amount": 100}).status_code == 200
+    response = client.post("/transactions/create", headers=headers, json={"amount": 200})
+
+    assert response.status_code == 422
+
+def test_concurrent_repeats_create_one_advance(client, auth_headers, db):
+    headers = {**auth_headers(), "Idempotency-Key": "advance-3"}
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        responses = list(pool.map(
+            lambda _: client.post("/transactions/create", headers=headers, json={"amount": 100}), range(6)
+        ))
+
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert sum(response.headers.get(IDEMPOTENCY_REPLAYED_HEADER) == "true" for response in responses) == 5
+    user_id = responses[0].json()["user_id"]
+    assert db.query(Transaction).filter_by(user_id=user_id).count() == 1
+
+def test_failed_write_is_not_remembered(client, auth_headers, db):
+    headers = {**auth_headers(), "Idempotency-Key": "too-much"}
+
+    assert client.post("/transactions/create", headers=headers, json={"amount": 999999}).status_code == 400
+    assert db.query(IdempotencyKey).filter_by(key="too-much").count() == 0
+    assert client.post("/transactions/create", headers=headers, json={"amount": 999999}).status_code == 400
+
+def hold_key(db, user_id: int, key: str, age: timedelta = timedelta(0)) -> IdempotencyKey:
+    # A pending claim, as left by a request still running (or one that died).
+    row = IdempotencyKey(
+        scope="transactions/create", user_id=user_id, key=key,
+        fingerprint=request_fingerprint(TransactionCreate(amount=100)), created_at=datetime.utcnow() - age,
+    )
+    db.add(row)
+    db.commit()
+    return row
+
+def test_repeat_of_a_running_request_gets_409(client, auth_headers, db, monkeypatch):
+    headers = {**auth_headers(), "Idempotency-Key": "advance-4"}
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+    hold_key(db, user_id, "advance-4")
+    monkeypatch.setattr(idempotency_store, "wait_seconds", 0.2)
+
+    response = client.post("/transactions/create", headers=headers, json={"amount": 100})
+
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert db.query(Transaction).filter_by(user_id=user_id).count() == 0
+
+def test_abandoned_claim_is_taken_over(client, auth_headers, db):
+    headers = {**auth_headers(), "Idempotency-Key": "advance-5"}
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+    hold_key(db, user_id, "advance-5", age=timedelta(seconds=idempotency_store.claim_timeout_seconds + 1))
+
+    response = client.post("/transactions/create", headers=headers, json={"amount": 100})
+
+    assert response.status_code == 200
+    db.expire_all()
+    stored = db.query(IdempotencyKey).filter_by(user_id=user_id, key="advance-5").one()
+    assert stored.response == response.json()
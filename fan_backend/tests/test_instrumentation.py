@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import main
+from app.database import engine
+from app.instrumentation import slow_query_samples
+
+def test_failed_statement_does_not_leak_its_start_time():
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM no_such_table"))
+        conn.execute(text("SELECT 1"))
+
+        assert conn.info["query_started_at"] == []
+
+def test_slow_query_samples_hold_only_the_fingerprint():
+    statement = "SELECT * FROM users WHERE phone = '0701234567' AND id IN (?, ?, ?) LIMIT 51"
+
+    recorded = slow_query_samples.record("/test", statement, 0.5)
+
+    assert recorded == "SELECT * FROM users WHERE phone = ? AND id IN (?, ...) LIMIT ?"
+    assert "0701234567" not in "\n".join(slow_query_samples.samples())
+
+def test_metrics_require_the_token_when_one_is_set(client, monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "fan_http_request_duration_seconds" in response.text
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.ledger import CreditLedger, CreditLimitExceeded, PaymentRejected
+from app.models import CreditAccount, Transaction
+from app.services import PaymentService, TransactionService
+
+def balance(db, user) -> float:
+    db.expire_all()
+    return db.get(CreditAccount, user.id).outstanding_balance
+
+def test_reserve_holds_credit_up_to_the_limit(db, make_user):
+    user = make_user(credit_limit=1000.0)
+
+    CreditLedger.reserve(user.id, 600.0, db)
+    CreditLedger.reserve(user.id, 400.0, db)
+    db.commit()
+    assert balance(db, user) == 1000.0
+
+    with pytest.raises(CreditLimitExceeded):
+        CreditLedger.reserve(user.id, 0.01, db)
+    db.rollback()
+    assert balance(db, user) == 1000.0
+
+def test_payment_releases_credit_and_is_capped(db, make_user):
+    user = make_user(credit_limit=1000.0)
+    transaction = TransactionService.create_advance_request(user.id, 800.0, None, db)
+    assert balance(db, user) == 800.0
+
+    PaymentService.process_payment(transaction.id, user.id, 300.0, "USSD", db)
+    assert balance(db, user) == 500.0
+
+    with pytest.raises(PaymentRejected):
+        PaymentService.process_payment(transaction.id, user.id, 500.01, "USSD", db)
+    db.rollback()
+    with pytest.raises(PaymentRejected):
+        PaymentService.process_payment(transaction.id, user.id, -5.0, "USSD", db)
+    db.rollback()
+
+    PaymentService.process_payment(transaction.id, user.id, 500.0, "USSD", db)
+    assert balance(db, user) == 0.0
+    assert CreditLedger.compute_exposure(db, [user.id]).get(user.id, 0.0) == 0.0
+
+def test_expiry_releases_the_unpaid_remainder(db, make_user):
+    user = make_user(credit_limit=1000.0)
+    transaction = TransactionService.create_advance_request(user.id, 1000.0, None, db)
+    PaymentService.process_payment(transaction.id, user.id, 250.0, "USSD", db)
+    with pytest.raises(CreditLimitExceeded):
+        TransactionService.create_advance_request(user.id, 500.0, None, db)
+    db.rollback()
+
+    db.get(Transaction, transaction.id).expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    expired = TransactionService.expire_transactions(db, Transaction.id == transaction.id)
+    db.commit()
+
+    assert [row.id for row in expired] == [transaction.id]
+    assert balance(db, user) == 0.0
+    with pytest.raises(PaymentRejected):
+        PaymentService.process_payment(transaction.id, user.id, 10.0, "USSD", db)
+    db.rollback()
+    TransactionService.create_advance_request(user.id, 1000.0, None, db)
+    assert balance(db, user) == 1000.0
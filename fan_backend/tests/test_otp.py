@@ -0,0 +1,22 @@
+import random
+
+import pytest
+
+from app.models import OTPVerification
+from app.otp import OTPStore
+
+def test_store_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        OTPStore()
+
+def test_code_is_committed_once_and_consumed_once(client, db):
+    phone = "071" + "".join(random.choices("0123456789", k=8))
+
+    assert client.post("/auth/send-otp", json={"phone": phone}).status_code == 200
+    otp_code = db.query(OTPVerification).filter_by(phone=phone).one().otp_code
+
+    verify = {"phone": phone, "otp_code": otp_code}
+    assert client.post("/auth/verify-otp", json=verify).status_code == 200
+    assert client.post("/auth/verify-otp", json=verify).status_code == 400
+    db.expire_all()
+    assert db.query(OTPVerification).filter_by(phone=phone).one().verified
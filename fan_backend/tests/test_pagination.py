@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.pagination import decode_cursor, encode_cursor, naive_utc
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 1, 2, 3, 4, 5, 678901)
+
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor("not-a-cursor")
+    assert raised.value.status_code == 400
+
+def test_offset_bounds_are_converted_to_utc():
+    bound = datetime(2026, 1, 2, 12, 0, tzinfo=timezone(timedelta(hours=5)))
+
+    assert naive_utc(bound) == datetime(2026, 1, 2, 7, 0)
+    assert naive_utc(datetime(2026, 1, 2, 12, 0)) == datetime(2026, 1, 2, 12, 0)
+
+def test_cursor_pages_cover_the_list_once(client, auth_headers):
+    headers = auth_headers()
+    ids = [client.post("/transactions/create", headers=headers, json={"amount": 10}).json()["id"] for _ in range(5)]
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/transactions/my", headers=headers, params=params)
+        assert response.status_code == 200
+        seen += [transaction["id"] for transaction in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        assert response.headers["X-Has-More"] == ("true" if cursor else "false")
+        if not cursor:
+            break
+
+    assert seen == sorted(ids, reverse=True)
+    assert pages == 3
+
+def test_request_without_a_limit_gets_the_default_page(client, auth_headers):
+    headers = auth_headers()
+    ids = [client.post("/transactions/create", headers=headers, json={"amount": 10}).json()["id"] for _ in range(3)]
+
+    response = client.get("/transactions/my", headers=headers)
+
+    assert [transaction["id"] for transaction in response.json()] == sorted(ids, reverse=True)
+    assert response.headers["X-Has-More"] == "false"
+
+def test_invalid_cursor_returns_400(client, auth_headers):
+    response = client.get("/transactions/my", headers=auth_headers(), params={"cursor": "zz"})
+
+    assert response.status_code == 400
+
+def test_date_filter_honours_the_offset(client, auth_headers):
+    headers = auth_headers()
+    created = client.post("/transactions/create", headers=headers, json={"amount": 10}).json()
+    created_at = datetime.fromisoformat(created["created_at"]).replace(tzinfo=timezone.utc)
+    # A minute before creation, written in UTC+05:00; with the offset dropped
+    # it would read as almost five hours after it.
+    bound = (created_at - timedelta(minutes=1)).astimezone(timezone(timedelta(hours=5))).isoformat()
+
+    after = client.get("/transactions/my", headers=headers, params={"created_from": bound})
+    before = client.get("/transactions/my", headers=headers, params={"created_to": bound})
+
+    assert [transaction["id"] for transaction in after.json()] == [created["id"]]
+    assert before.json() == []
@@ -0,0 +1,62 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal
+from app.models import Transaction
+from app.services import TransactionService
+
+def add_transaction(db, user, expires_in=timedelta(hours=1), status="pending") -> Transaction:
+    transaction = Transaction(
+        user_id=user.id,
+        amount=100.0,
+        qr_code=uuid.uuid4().hex[:12].upper(),
+        status=status,
+        expires_at=datetime.utcnow() + expires_in,
+    )
+    db.add(transaction)
+    db.commit()
+    return transaction
+
+def test_concurrent_scans_have_a_single_winner(db, make_user):
+    transaction = add_transaction(db, make_user())
+    qr_code = transaction.qr_code
+    scanners = 8
+    barrier = threading.Barrier(scanners)
+
+    def scan(station_id):
+        with SessionLocal() as session:
+            barrier.wait()
+            redeemed = TransactionService.validate_qr_scan(qr_code, station_id, session)
+            return None if redeemed is None else redeemed.station_id
+
+    with ThreadPoolExecutor(max_workers=scanners) as pool:
+        results = list(pool.map(scan, range(1, scanners + 1)))
+
+    winners = [station_id for station_id in results if station_id is not None]
+    assert len(winners) == 1
+    db.expire_all()
+    stored = db.get(Transaction, transaction.id)
+    assert stored.status == "completed"
+    assert stored.station_id == winners[0]
+
+def test_expired_code_is_not_redeemed(db, make_user):
+    transaction = add_transaction(db, make_user(), expires_in=timedelta(seconds=-1))
+
+    assert TransactionService.validate_qr_scan(transaction.qr_code, 1, db) is None
+    db.expire_all()
+    assert db.get(Transaction, transaction.id).status == "expired"
+
+def test_batch_classifies_each_code(db, make_user):
+    user = make_user()
+    pending = add_transaction(db, user)
+    used = add_transaction(db, user, status="completed")
+    expired = add_transaction(db, user, expires_in=timedelta(seconds=-1))
+
+    results = TransactionService.redeem_qr_batch([
+        (pending.qr_code, 1), (pending.qr_code, 2), (used.qr_code, 1), (expired.qr_code, 1), ("NOSUCHCODE00", 1)
+    ], db)
+
+    assert [result["result"] for result in results] == ["redeemed", "already_used", "already_used", "expired", "unknown"]
+    assert results[0]["transaction"].station_id == 1
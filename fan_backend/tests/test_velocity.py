@@ -0,0 +1,37 @@
+import uuid
+from datetime import datetime, timedelta
+
+from app import velocity
+from app.models import Transaction
+from app.velocity import VELOCITY_HISTORY_DAYS, VelocityTracker
+
+def add_advance(db, user, created_at: datetime) -> Transaction:
+    transaction = Transaction(
+        user_id=user.id,
+        amount=100.0,
+        qr_code=uuid.uuid4().hex[:12].upper(),
+        status="pending",
+        expires_at=created_at + timedelta(hours=1),
+        created_at=created_at,
+    )
+    db.add(transaction)
+    db.commit()
+    return transaction
+
+def test_idle_windows_are_evicted(db, make_user, monkeypatch):
+    monkeypatch.setattr(velocity, "VELOCITY_CHECKS", True)
+    now = datetime.utcnow()
+    active, idle = make_user(), make_user()
+    add_advance(db, active, now - timedelta(hours=2))
+    add_advance(db, idle, now - timedelta(days=VELOCITY_HISTORY_DAYS - 1))
+    tracker = VelocityTracker()
+    tracker.hydrate(db)
+    tracker.score(idle.id, 100.0, db)
+
+    assert tracker.evict_idle(now + timedelta(days=2)) >= 1
+    assert idle.id not in tracker._users
+    assert active.id in tracker._users
+    assert tracker.score(active.id, 100.0, db, now=now).advances_last_day == 1
+
+    tracker.record_advance(idle.id, 100.0, now + timedelta(days=2), db)
+    assert tracker.score(idle.id, 100.0, db, now=now + timedelta(days=2)).advances_last_day == 1
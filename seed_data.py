@@ -4,6 +4,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'fan_backend'))
 
 from fan_backend.app.database import SessionLocal, create_tables
 from fan_backend.app.models import PartnerStation
+from fan_backend.app.services import StationService
 
 def seed_partner_stations():
     create_tables()
@@ -16,7 +17,8 @@ def seed_partner_stations():
             return
         
         stations = [
-            PartnerStation(
+            dict(
+                external_id="seed-total-victoria-island",
                 name="Total Filling Station - Victoria Island",
                 address="123 Ahmadu Bello Way, Victoria Island, Lagos",
                 latitude=6.4281,
@@ -25,7 +27,8 @@ def seed_partner_stations():
                 operating_hours="24 Hours",
                 status="active"
             ),
-            PartnerStation(
+            dict(
+                external_id="seed-mobil-ikoyi",
                 name="Mobil Filling Station - Ikoyi",
                 address="45 Kingsway Road, Ikoyi, Lagos",
                 latitude=6.4474,
@@ -34,7 +37,8 @@ def seed_partner_stations():
                 operating_hours="6:00 AM - 10:00 PM",
                 status="active"
             ),
-            PartnerStation(
+            dict(
+                external_id="seed-oando-lekki",
                 name="Oando Filling Station - Lekki",
                 address="78 Lekki-Epe Expressway, Lekki, Lagos",
                 latitude=6.4698,
@@ -43,7 +47,8 @@ def seed_partner_stations():
                 operating_hours="24 Hours",
                 status="active"
             ),
-            PartnerStation(
+            dict(
+                external_id="seed-conoil-surulere",
                 name="Conoil Filling Station - Surulere",
                 address="12 Adeniran Ogunsanya Street, Surulere, Lagos",
                 latitude=6.5027,
@@ -52,7 +57,8 @@ def seed_partner_stations():
                 operating_hours="5:00 AM - 11:00 PM",
                 status="active"
             ),
-            PartnerStation(
+            dict(
+                external_id="seed-nnpc-ikeja",
                 name="NNPC Mega Station - Ikeja",
                 address="56 Obafemi Awolowo Way, Ikeja, Lagos",
                 latitude=6.6018,
@@ -63,10 +69,7 @@ def seed_partner_stations():
             )
         ]
         
-        for station in stations:
-            db.add(station)
-        
-        db.commit()
+        StationService.bulk_upsert_stations(stations, db)
         print(f"Successfully seeded {len(stations)} partner stations.")
         
     except Exception as e: